@@ -0,0 +1,19 @@
+"""
+ASGI config for MiniContest project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+to be served by any ASGI server, e.g. ``uvicorn MiniContest.asgi:application``.
+Scoreboard reads run on the event loop, the rest goes through the WSGI
+application on a thread pool (see contest.asgi).
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MiniContest.settings')
+django.setup()
+
+from contest.asgi import ContestASGIApplication  # noqa: E402
+
+application = ContestASGIApplication()
@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'contest.metrics.MetricsMiddleware',
+    'contest.profiling.QueryProfileMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -75,6 +77,8 @@ WSGI_APPLICATION = 'MiniContest.wsgi.application'
 
 CORS_ORIGIN_ALLOW_ALL = True
 
+CORS_EXPOSE_HEADERS = ['X-Scoreboard-Version']
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
@@ -82,9 +86,82 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # on disk rather than in memory, so threaded tests get sqlite's regular locking
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
+# Run on every new sqlite connection (see contest.apps). The production profile
+# (CONTEST_DB_PROFILE=production) lets readers and the writer work side by side
+# with WAL, waits for a busy lock instead of failing, syncs less often (still
+# durable against application crashes), keeps 64MB of pages in memory and
+# reuses connections across requests.
+
+SQLITE_PRODUCTION_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,
+}
+
+if os.environ.get('CONTEST_DB_PROFILE') == 'production':
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+else:
+    SQLITE_PRAGMAS = {}
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The rendered scoreboard lives here until a score changes, and so do the admin forms'
+# idempotency tokens (see contest.idempotency). The local memory cache is per process:
+# with several workers use a shared backend, or a replayed form may be saved twice.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'minicontest',
+    }
+}
+
+# Request and operation timings on /api/metrics/ (see contest.metrics), off costs nothing.
+
+CONTEST_METRICS = os.environ.get('CONTEST_METRICS') == '1'
+
+# Lets a scraper read /api/metrics/ with `Authorization: Bearer <token>`, otherwise only staff users can.
+
+CONTEST_METRICS_TOKEN = os.environ.get('CONTEST_METRICS_TOKEN')
+
+# Logs every request's SQL by call site and warns about repeated queries (see contest.profiling).
+
+CONTEST_QUERY_PROFILE = os.environ.get('CONTEST_QUERY_PROFILE') == '1'
+
+# Applies score mutations on one writer thread in batched transactions (see contest.writer).
+
+CONTEST_WRITE_QUEUE = os.environ.get('CONTEST_WRITE_QUEUE') == '1'
+
+# Times a score change is retried when a team changed between reading and writing it (see contest.models.change_scores).
+
+SCORE_UPDATE_RETRIES = 10
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'contest.queries': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
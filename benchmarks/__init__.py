@@ -0,0 +1,66 @@
+"""
+Ad-hoc performance benchmarks.
+
+Each module runs against a throw-away test database, e.g.::
+
+    python -m benchmarks.scoreboard
+"""
+import atexit
+import os
+import time
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MiniContest.settings')
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    setup_test_environment(debug=False)
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    atexit.register(connection.creation.destroy_test_db, old_name, verbosity=0)
+
+
+def measure(func, duration=2.0):
+    """
+    Calls `func` repeatedly for about `duration` seconds, returns per-call timings in seconds.
+    """
+    timings = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def count_queries(func):
+    """
+    Runs `func` once, returns the number of queries it made and its result.
+    """
+    from django.db import connection, reset_queries
+    from django.test.utils import CaptureQueriesContext
+
+    # every request empties the query log, so start from an empty one
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        result = func()
+    return len(queries), result
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def report(name, timings, queries=None):
+    total = sum(timings)
+    ordered = sorted(timings)
+    line = (f"{name:<40} {len(timings) / total:>10.1f} req/s  "
+            f"p50 {percentile(ordered, 0.5) * 1000:>8.2f}ms  "
+            f"p90 {percentile(ordered, 0.9) * 1000:>8.2f}ms  "
+            f"p99 {percentile(ordered, 0.99) * 1000:>8.2f}ms")
+    if queries is not None:
+        line += f"  {queries:>4} queries"
+    print(line)
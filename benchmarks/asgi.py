@@ -0,0 +1,125 @@
+"""
+Scoreboard requests while many viewers hold the event stream open, on the
+WSGI path (a server with a fixed number of worker threads, one per open
+stream) and on the ASGI application (one coroutine per stream).
+
+    python -m benchmarks.asgi
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup, percentile
+
+THREADS = 16
+REQUESTS = 500
+HOLD = 1.0
+
+
+def scope(path):
+    return {'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [],
+            'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+
+
+def summary(name, timings, elapsed):
+    ordered = sorted(timings)
+    print(f"  {name:<6} {len(timings) / elapsed:>8.1f} req/s  p50 {percentile(ordered, 0.5) * 1000:>9.2f}ms  "
+          f"p99 {percentile(ordered, 0.99) * 1000:>9.2f}ms")
+
+
+def wsgi(viewers):
+    from django.core.wsgi import get_wsgi_application
+    from contest.asgi import ContestASGIApplication
+
+    application = get_wsgi_application()
+
+    def call(path, hold=0.0):
+        start = time.perf_counter()
+        response = application(ContestASGIApplication.environ(scope(path), b''), lambda status, headers: None)
+        for _ in response:
+            if time.perf_counter() - start >= hold:
+                break
+        response.close()
+
+    def request(submitted):
+        call('/api/scoreboard/')
+        # a request waits for a free thread before it even starts, that is part of its latency
+        return time.perf_counter() - submitted
+
+    # like a threaded WSGI server: every open connection takes one of its threads
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        start = time.perf_counter()
+        for _ in range(viewers):
+            pool.submit(call, '/api/scoreboard/stream/', HOLD)
+        futures = [pool.submit(request, time.perf_counter()) for _ in range(REQUESTS)]
+        timings = [future.result() for future in futures]
+        elapsed = time.perf_counter() - start
+    return timings, elapsed
+
+
+def asgi(viewers):
+    from contest.asgi import ContestASGIApplication
+
+    application = ContestASGIApplication(threads=THREADS)
+
+    async def viewer():
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            pass
+
+        asyncio.get_event_loop().call_later(HOLD, disconnect.set)
+        await application(scope('/api/scoreboard/stream/'), receive, send)
+
+    async def request(submitted):
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            pass
+
+        await application(scope('/api/scoreboard/'), receive, send)
+        return time.perf_counter() - submitted
+
+    async def run():
+        viewing = [asyncio.ensure_future(viewer()) for _ in range(viewers)]
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(request(start) for _ in range(REQUESTS)))
+        elapsed = time.perf_counter() - start
+        await asyncio.gather(*viewing)
+        return timings, elapsed
+
+    timings, elapsed = asyncio.run(run())
+    application.executor.shutdown()
+    return timings, elapsed
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from contest.scoreboard import broadcaster, get_scoreboard
+
+    call_command('generate_contest', teams=200, problems=60, attempts=3000, duels=500, transactions=20000, seed=0)
+    get_scoreboard()
+    # a viewer notices it should leave on its next event, keep-alives included
+    broadcaster.heartbeat = HOLD / 4
+    print(f"{REQUESTS} scoreboard requests, viewers keep the stream open {HOLD:.0f}s, "
+          f"{THREADS} threads for WSGI and for the ASGI thread pool")
+    for viewers in (0, 64, 2000):
+        print(f"\n{viewers} viewers")
+        if viewers <= 64:
+            timings, elapsed = wsgi(viewers)
+            summary('wsgi', timings, elapsed)
+        else:
+            print(f"  wsgi   {viewers} viewers take {viewers / THREADS * HOLD:.0f}s of threads before any request")
+        timings, elapsed = asgi(viewers)
+        summary('asgi', timings, elapsed)
+        broadcaster.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Latency and query count of the admin "request duel" page and of picking a
+random opponent, as the number of teams grows.
+"""
+from benchmarks import setup, count_queries, measure, report
+
+TEAM_COUNTS = (50, 200, 800)
+
+
+def main():
+    setup()
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from contest.forms import RequestForDuelForm
+    from contest.models import Problem, Team, Duel
+
+    client = Client()
+    client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+    Problem.objects.bulk_create(Problem(id=i, level='E', type='D') for i in range(1, 21))
+    team = Team.objects.create(name='requester')
+    url = f'/admin/contest/team/{team.id}/request-duel/'
+
+    def pick_opponent():
+        form = RequestForDuelForm({'type': '1'}, team_id=team.id)
+        assert form.is_valid(), form.errors
+
+    created = 0
+    for count in TEAM_COUNTS:
+        Team.objects.bulk_create(Team(name=f'team-{i}') for i in range(created, count))
+        created = count
+        # every fourth team is busy with a duel
+        busy = list(Team.objects.exclude(id=team.id).filter(duel=None)[:count // 8 * 2])
+        Duel.objects.bulk_create(Duel(requested_by=a, to=b, problem_id=1, type='1')
+                                 for a, b in zip(busy[::2], busy[1::2]))
+        print(f"\n{count} teams")
+        for name, func in (('GET request-duel page', lambda: client.get(url)),
+                           ('random opponent and problem', pick_opponent)):
+            queries, _ = count_queries(func)
+            report(f'  {name}', measure(func, duration=1.0), queries=queries)
+
+
+if __name__ == '__main__':
+    main()
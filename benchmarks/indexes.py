@@ -0,0 +1,72 @@
+"""
+Query plans and latencies of the contest's hot filters on a large synthetic
+contest, with the indexes of migration 0006 and after dropping them.
+"""
+from benchmarks import setup, measure, report
+
+TEAMS = 2000
+PROBLEMS = 200
+ATTEMPTS_PER_TEAM = 20
+DUELS = 20000
+TRANSACTIONS = 200000
+
+
+def seed():
+    from django.core.management import call_command
+    from contest.models import Team
+
+    call_command('generate_contest', teams=TEAMS, problems=PROBLEMS, attempts=TEAMS * ATTEMPTS_PER_TEAM,
+                 duels=DUELS, transactions=TRANSACTIONS, seed=0, verbosity=0)
+    return list(Team.objects.values_list('id', flat=True))
+
+
+def hot_queries(team_id):
+    from contest.models import Team, SolvingAttempt, Duel, Transaction
+
+    return {
+        'attempts by (team, state)': lambda: SolvingAttempt.objects.filter(team_id=team_id, state='S').count(),
+        'duels by (to, to_returned)': lambda: Duel.objects.filter(to_id=team_id, to_returned=False).count(),
+        'duels by (requested_by, req_returned)':
+            lambda: Duel.objects.filter(requested_by_id=team_id, req_returned=False).count(),
+        'top 20 teams by score': lambda: list(Team.objects.values_list('id', flat=True)[:20]),
+        'transactions by reason': lambda: list(Transaction.objects.filter(reason='MF').values_list('id')[:50]),
+        'transactions by team and reason':
+            lambda: list(Transaction.objects.filter(decreased_from_id=team_id, reason='PR').values_list('id')),
+    }
+
+
+def plans(team_id):
+    from contest.models import Team, SolvingAttempt, Duel, Transaction
+
+    return {
+        'attempts by (team, state)': SolvingAttempt.objects.filter(team_id=team_id, state='S'),
+        'duels by (to, to_returned)': Duel.objects.filter(to_id=team_id, to_returned=False),
+        'top 20 teams by score': Team.objects.all()[:20],
+        'transactions by team and reason': Transaction.objects.filter(decreased_from_id=team_id, reason='PR'),
+    }
+
+
+def run(label, team_id):
+    print(f"\n{label}")
+    for name, queryset in plans(team_id).items():
+        print(f"  plan {name}: {queryset.explain()}")
+    for name, func in hot_queries(team_id).items():
+        report(f'  {name}', measure(func, duration=1.0))
+
+
+def main():
+    setup()
+    from django.db import connection
+    from contest.models import Team, SolvingAttempt, Duel, Transaction
+
+    team_id = seed()[TEAMS // 2]
+    run('with indexes', team_id)
+    with connection.schema_editor() as editor:
+        for model in (Team, SolvingAttempt, Duel, Transaction):
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    run('without indexes', team_id)
+
+
+if __name__ == '__main__':
+    main()
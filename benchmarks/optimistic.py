@@ -0,0 +1,84 @@
+"""
+Throughput and latency of concurrent score changes on a few hot teams, applied
+optimistically (Transaction.objects.transfer(), conditional on the team
+version) and pessimistically (the row is locked by a write before its score
+is read, which is what select_for_update amounts to on sqlite).
+
+    python -m benchmarks.optimistic
+"""
+import threading
+import time
+
+from benchmarks import setup, percentile
+
+WRITER_COUNTS = (1, 4, 16)
+HOT_TEAMS = 2
+ROUNDS = 60
+
+
+def pessimistic_transfer(team, amount):
+    from django.db import transaction
+    from django.db.models import F
+    from contest.models import Team, Transaction
+    from contest.scoreboard import invalidate_scoreboard, invalidate_team
+
+    with transaction.atomic():
+        Team.allobjs.filter(pk=team.pk).update(version=F('version'))
+        score = Team.allobjs.filter(pk=team.pk).values_list('score', flat=True).get()
+        Team.allobjs.filter(pk=team.pk).update(score=score + amount, version=F('version') + 1)
+        Transaction.objects.create(decreased_from=Team.SHEKIB_JIB, increased_to=team, amount=amount,
+                                   reason=Transaction.MAFIA)
+    invalidate_team(team.pk)
+    invalidate_scoreboard()
+
+
+def run(writers, optimistic):
+    from django.db import connection
+    from contest.models import Team, Transaction
+
+    teams = [Team.objects.create(name=f'hot-{i}', score=10 ** 6) for i in range(HOT_TEAMS)]
+    house = Team.SHEKIB_JIB
+    timings, errors = [], []
+
+    def writer(index):
+        try:
+            for j in range(ROUNDS):
+                start = time.perf_counter()
+                try:
+                    # loaded first like the admin forms, other writers change it before the write
+                    team = Team.objects.get(pk=teams[(index + j) % HOT_TEAMS].pk)
+                    if optimistic:
+                        Transaction.objects.transfer(house, team, 1, Transaction.MAFIA)
+                    else:
+                        pessimistic_transfer(team, 1)
+                except Exception as e:
+                    errors.append(e)
+                timings.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=writer, args=(i, )) for i in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    lost = sum(10 ** 6 + team.increases.count() - team.score
+               for team in Team.objects.filter(pk__in=[team.pk for team in teams]))
+    ordered = sorted(timings)
+    print(f"  {'optimistic' if optimistic else 'pessimistic':<12} {len(timings) / elapsed:>8.1f} changes/s  "
+          f"p50 {percentile(ordered, 0.5) * 1000:>8.2f}ms  p99 {percentile(ordered, 0.99) * 1000:>8.2f}ms  "
+          f"{lost:g} lost  {len(errors)} errors{f' ({errors[0]})' if errors else ''}")
+
+
+def main():
+    setup()
+    for writers in WRITER_COUNTS:
+        print(f"\n{writers} concurrent writers, {ROUNDS} score changes each on {HOT_TEAMS} teams")
+        run(writers, optimistic=False)
+        run(writers, optimistic=True)
+
+
+if __name__ == '__main__':
+    main()
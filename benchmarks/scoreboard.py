@@ -0,0 +1,50 @@
+"""
+Requests per second of /api/scoreboard/ with and without the scoreboard cache,
+and payload size of a full poll against a `?since=` delta poll.
+"""
+from benchmarks import setup, measure, report
+
+TEAMS = 200
+PROBLEMS = 40
+
+
+def main():
+    setup()
+    from django.test import Client
+    from contest.models import Problem, Team, SolvingAttempt, Duel
+    from contest.scoreboard import invalidate_scoreboard
+    from django.utils import timezone
+
+    Problem.objects.bulk_create(Problem(id=i, level='E', type='P') for i in range(1, PROBLEMS + 1))
+    Team.objects.bulk_create(Team(name=f'team-{i}', score=500 + i) for i in range(TEAMS))
+    now = timezone.now()
+    SolvingAttempt.objects.bulk_create(
+        SolvingAttempt(team=team, problem_id=i % PROBLEMS + 1, cost=100, start_time=now, state='SD')
+        for i, team in enumerate(Team.objects.all())
+    )
+    client = Client()
+
+    def uncached():
+        invalidate_scoreboard()
+        client.get('/api/scoreboard/')
+
+    def cached():
+        client.get('/api/scoreboard/')
+
+    print(f"scoreboard, {TEAMS} teams")
+    report('uncached (rebuilt on every hit)', measure(uncached))
+    report('cached', measure(cached))
+
+    version = client.get('/api/scoreboard/')['X-Scoreboard-Version']
+    Problem.objects.create(id=PROBLEMS + 1, level='E', type='D')
+    first, second = Team.objects.all()[TEAMS // 2:TEAMS // 2 + 2]
+    duel = Duel.objects.create(requested_by=first, to=second, problem_id=PROBLEMS + 1, type='1', winner=second)
+    duel.save(set_winner=True)
+    full = client.get('/api/scoreboard/').content
+    delta = client.get('/api/scoreboard/', {'since': version}).content
+    print(f"payload after one duel: full {len(full)} bytes, delta {len(delta)} bytes")
+    report('delta poll', measure(lambda: client.get('/api/scoreboard/', {'since': version})))
+
+
+if __name__ == '__main__':
+    main()
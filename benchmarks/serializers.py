@@ -0,0 +1,41 @@
+"""
+Serialization time and queries per 1,000 attempts and duels: the nested
+depth = 1 serializers as they were, the same with select_related, and the
+flat list serializers behind /api/attempts/ and /api/duels/.
+
+    python -m benchmarks.serializers
+"""
+from benchmarks import setup, count_queries, measure, report
+
+ROWS = 1000
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from contest.models import Duel, SolvingAttempt
+    from contest.serializers import (DuelListSerializer, DuelSerializer, SolvingAttemptListSerializer,
+                                     SolvingAttemptSerializer)
+
+    call_command('generate_contest', teams=200, problems=60, attempts=ROWS, duels=ROWS, transactions=5000, seed=0)
+    cases = (
+        ('attempts, depth = 1', SolvingAttemptSerializer, SolvingAttempt.objects.all()),
+        ('attempts, depth = 1 + select_related', SolvingAttemptSerializer,
+         SolvingAttempt.objects.select_related('team', 'problem')),
+        ('attempts, flat', SolvingAttemptListSerializer, SolvingAttempt.objects.select_related('team', 'problem')),
+        ('duels, depth = 1', DuelSerializer, Duel.objects.all()),
+        ('duels, depth = 1 + select_related', DuelSerializer,
+         Duel.objects.select_related('requested_by', 'to', 'winner', 'problem')),
+        ('duels, flat', DuelListSerializer, Duel.objects.select_related('requested_by', 'to', 'winner')),
+    )
+    print(f"per {ROWS} rows")
+    for name, serializer, queryset in cases:
+        def serialize():
+            return serializer(queryset.order_by('id')[:ROWS], many=True).data
+
+        queries, _ = count_queries(serialize)
+        report(name, measure(serialize, duration=2.0), queries=queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Mixed load of scoreboard ranking reads and admin score changes from concurrent
+threads, on sqlite's default settings and on the production profile
+(settings.SQLITE_PRODUCTION_PRAGMAS plus persistent connections).
+
+    python -m benchmarks.sqlite_profile
+"""
+import threading
+import time
+
+from benchmarks import setup, percentile
+
+READERS = 8
+WRITERS = 4
+DURATION = 3.0
+
+
+def run(name, pragmas, conn_max_age):
+    from django.db import close_old_connections, connection, connections
+    from django.test.utils import override_settings
+    from contest.forms import ChangeScore
+    from contest.models import Team
+
+    teams = list(Team.objects.values_list('id', flat=True)[:WRITERS])
+    timings = {'read': [], 'write': []}
+    errors = []
+    deadline = time.perf_counter() + DURATION
+
+    def read():
+        # the ranking query of a scoreboard rebuild, without the serialization
+        list(Team.objects.ranked().values_list('id', 'score', 'rank'))
+
+    def write(index):
+        form = ChangeScore({'change_score': 1, 'reason': 'MF'}, team_id=teams[index])
+        form.is_valid()
+        form.save()
+
+    def worker(kind, func, *args):
+        try:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    func(*args)
+                except Exception as e:
+                    errors.append(e)
+                timings[kind].append(time.perf_counter() - start)
+                # what the end of a request does: close the connection unless CONN_MAX_AGE keeps it
+                close_old_connections()
+        finally:
+            connection.close()
+
+    connection.close()
+    connections.databases['default']['CONN_MAX_AGE'] = conn_max_age
+    with override_settings(SQLITE_PRAGMAS=pragmas):
+        threads = [threading.Thread(target=worker, args=('read', read)) for _ in range(READERS)]
+        threads += [threading.Thread(target=worker, args=('write', write, i)) for i in range(WRITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        connection.close()
+    print(f"\n{name}")
+    for kind, values in timings.items():
+        ordered = sorted(values)
+        print(f"  {kind:<6} {len(values) / DURATION:>8.1f} ops/s  p50 {percentile(ordered, 0.5) * 1000:>8.2f}ms  "
+              f"p99 {percentile(ordered, 0.99) * 1000:>8.2f}ms")
+    print(f"  {len(errors)} errors{f' ({errors[0]})' if errors else ''}")
+
+
+def main():
+    setup()
+    from django.conf import settings
+    from django.core.management import call_command
+
+    call_command('generate_contest', teams=200, problems=60, attempts=3000, duels=500, transactions=20000, seed=0)
+    print(f"{READERS} readers ranking the teams, {WRITERS} writers changing scores, {DURATION:.0f}s each")
+    # journal_mode is stored in the database file, so go back to the default explicitly
+    run('default', {'journal_mode': 'DELETE'}, 0)
+    run('production', settings.SQLITE_PRODUCTION_PRAGMAS, 600)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Baseline for performance work: seeds a synthetic contest with the
+generate_contest command and drives the scoreboard, the TeamAdmin
+changelist and every form in contest.forms through the test client.
+
+    python -m benchmarks.suite --teams 200 --transactions 100000
+"""
+import argparse
+
+from benchmarks import setup, count_queries, measure, report
+
+
+def scenarios(client, team, duel, version):
+    from contest.scoreboard import invalidate_scoreboard, invalidate_team
+
+    admin = '/admin/contest/team'
+
+    def uncached_scoreboard():
+        invalidate_scoreboard()
+        return client.get('/api/scoreboard/')
+
+    def uncached_team_details():
+        invalidate_team(team.id)
+        return client.get(f'/api/teams/{team.id}/')
+
+    def uncached_history():
+        invalidate_scoreboard()
+        return client.get('/api/scoreboard/history/')
+
+    def export_ledger():
+        response = client.get('/api/transactions/export.csv')
+        for _ in response.streaming_content:
+            pass
+        return response
+
+    def modify_score():
+        return client.post(f'{admin}/{team.id}/modify-score/', {'change_score': 1, 'reason': 'MF'})
+
+    return {
+        'scoreboard': lambda: client.get('/api/scoreboard/'),
+        'scoreboard, rebuilt': uncached_scoreboard,
+        'scoreboard delta': lambda: client.get('/api/scoreboard/', {'since': version}),
+        'scoreboard at a time': lambda: client.get('/api/scoreboard/', {'at': '2100-01-01T00:00'}),
+        'score history': lambda: client.get('/api/scoreboard/history/'),
+        'score history, rebuilt': uncached_history,
+        'ledger export': export_ledger,
+        'team details': lambda: client.get(f'/api/teams/{team.id}/'),
+        'team details, rebuilt': uncached_team_details,
+        'team changelist': lambda: client.get(f'{admin}/'),
+        'transaction changelist': lambda: client.get('/admin/contest/transaction/'),
+        'RequestProblemForm page': lambda: client.get(f'{admin}/{team.id}/solve-attempt/'),
+        'ReturnProblemForm page': lambda: client.get(f'{admin}/{team.id}/return-problem/'),
+        'SetGradeForm page': lambda: client.get(f'{admin}/{team.id}/set-grade/'),
+        'ChangeScore page': lambda: client.get(f'{admin}/{team.id}/modify-score/'),
+        'ChangeScore submit': modify_score,
+        'RequestForDuelForm page': lambda: client.get(f'{admin}/{team.id}/request-duel/'),
+        'SetDuelWinner page': lambda: client.get(f'/admin/contest/duel/{duel.id}/set-winner/'),
+        'BulkGradeForm page': lambda: client.get(f'{admin}/bulk-grade/'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--teams', type=int, default=200)
+    parser.add_argument('--problems', type=int, default=60)
+    parser.add_argument('--attempts', type=int, default=3000)
+    parser.add_argument('--duels', type=int, default=500)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--duration', type=float, default=1.0, help='seconds per scenario')
+    parser.add_argument('--only', help='run only the scenarios containing this text')
+    args = parser.parse_args()
+
+    setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.test import Client
+    from contest.models import Team, Duel
+
+    call_command('generate_contest', teams=args.teams, problems=args.problems, attempts=args.attempts,
+                 duels=args.duels, transactions=args.transactions, seed=0)
+    call_command('checkpoint_scores')
+    client = Client()
+    client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+    team = Team.objects.order_by('id').first()
+    duel = Duel.objects.first()
+    version = client.get('/api/scoreboard/')['X-Scoreboard-Version']
+
+    for name, func in scenarios(client, team, duel, version).items():
+        if args.only and args.only not in name:
+            continue
+        queries, response = count_queries(func)
+        assert response.status_code in (200, 302), (name, response.status_code)
+        report(name, measure(func, duration=args.duration), queries=queries)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput and latency of concurrent score mutations (manual score changes,
+purchases and gradings) applied directly and through the single writer of
+contest.writer, as the number of concurrent writers grows.
+
+    python -m benchmarks.write_queue
+"""
+import threading
+import time
+
+from benchmarks import setup, percentile
+
+WRITER_COUNTS = (1, 4, 16)
+ROUNDS = 40
+
+
+def run(writers, queued):
+    from django.db import connection
+    from django.test.utils import override_settings
+    from contest.forms import ChangeScore, RequestProblemForm
+    from contest.models import Problem, Team
+    from contest.writer import write_queue
+
+    teams = [Team.objects.create(name=f'writer-{i}', score=10 ** 6) for i in range(writers)]
+    first_problem = (Problem.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    Problem.objects.bulk_create(Problem(id=first_problem + i, level='E', type='P') for i in range(writers * ROUNDS))
+    timings, errors = [], []
+
+    def writer(index):
+        team = teams[index]
+        try:
+            for j in range(ROUNDS):
+                start = time.perf_counter()
+                try:
+                    form = ChangeScore({'change_score': 1, 'reason': 'MF'}, team_id=team.id)
+                    form.is_valid()
+                    form.save()
+                    # the judges' path, the attempt only carries team_id
+                    form = RequestProblemForm({'problem': str(first_problem + index * ROUNDS + j), 'cost': 100},
+                                              team_id=team.id)
+                    form.is_valid()
+                    attempt = form.save()
+                    attempt.grade = 75
+                    attempt.save(cal_reward=True)
+                except Exception as e:
+                    errors.append(e)
+                timings.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    with override_settings(CONTEST_WRITE_QUEUE=queued):
+        threads = [threading.Thread(target=writer, args=(i, )) for i in range(writers)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        write_queue.stop()
+    ordered = sorted(timings)
+    print(f"  {'queued' if queued else 'direct':<8} {len(timings) / elapsed:>8.1f} rounds/s  "
+          f"p50 {percentile(ordered, 0.5) * 1000:>8.2f}ms  p99 {percentile(ordered, 0.99) * 1000:>8.2f}ms  "
+          f"{len(errors)} errors{f' ({errors[0]})' if errors else ''}")
+
+
+def main():
+    setup()
+    for writers in WRITER_COUNTS:
+        print(f"\n{writers} concurrent writers, {ROUNDS} rounds of score change + purchase + grading each")
+        run(writers, queued=False)
+        run(writers, queued=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,34 @@
 from django import forms
 from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
 from django.http import HttpResponseRedirect
 from django.template.response import TemplateResponse
-from django.urls import re_path, reverse
+from django.urls import get_script_prefix, re_path, reverse
 from django.utils.html import format_html
 
 from .forms import (
     RequestProblemForm,
     ReturnProblemForm,
     SetGradeForm,
+    BulkGradeForm,
     ChangeScore,
     RequestForDuelForm,
     SetDuelWinner
 )
+from .idempotency import PENDING, recent_submissions
 from .models import *
 
 
+class CachedTeamFilter(admin.RelatedFieldListFilter):
+    """
+    Team filter whose choices come from Team.choices() instead of a query per page.
+    """
+
+    def field_choices(self, field, request, model_admin):
+        return Team.choices()
+
+
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'score', 'current_duels_count', 'solved_problems', 'team_actions', )
@@ -28,9 +41,35 @@ class TeamAdmin(admin.ModelAdmin):
 
     search_fields = ('name', )
 
+    def get_readonly_fields(self, request, obj=None):
+        # the form's score would be the one shown when it was opened, changes go through modify score instead
+        if obj is not None:
+            return self.readonly_fields + ('score', )
+        return self.readonly_fields
+
+    actions = ('grade_attempts', )
+
+    ACTION_URL_NAMES = (
+        'admin:solve-attempt',
+        'admin:modify-score',
+        'admin:set-grade',
+        'admin:return-problem',
+        'admin:request-duel',
+    )
+    ACTION_URL_PK = '__pk__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._action_urls = {}
+
     def get_urls(self):
         urls = super().get_urls()
         custom_urls = [
+            re_path(
+                r'^bulk-grade/$',
+                self.admin_site.admin_view(self.process_bulk_grade),
+                name='bulk-grade',
+            ),
             re_path(
                 r'^(?P<team_id>.+)/solve-attempt/$',
                 self.admin_site.admin_view(self.process_solve_attempt),
@@ -59,6 +98,26 @@ class TeamAdmin(admin.ModelAdmin):
         ]
         return custom_urls + urls
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_stats()
+
+    def current_duels_count(self, obj):
+        return obj.current_duels
+    current_duels_count.admin_order_field = 'current_duels'
+
+    def solved_problems(self, obj):
+        return obj.solved_count
+    solved_problems.admin_order_field = 'solved_count'
+
+    def _action_url_templates(self):
+        # reversed once per script prefix instead of five times per changelist row
+        prefix = get_script_prefix()
+        if prefix not in self._action_urls:
+            self._action_urls[prefix] = tuple(
+                reverse(name, args=[self.ACTION_URL_PK]) for name in self.ACTION_URL_NAMES
+            )
+        return self._action_urls[prefix]
+
     def team_actions(self, obj):
         return format_html(
             '<a class="button" href="{}">request problem</a>&nbsp;'
@@ -66,15 +125,49 @@ class TeamAdmin(admin.ModelAdmin):
             '<a class="button" href="{}">set grade</a>&nbsp;'
             '<a class="button" href="{}">return problem</a>&nbsp;'
             '<a class="button" href="{}">request duel</a>&nbsp;',
-            reverse('admin:solve-attempt', args=[obj.pk]),
-            reverse('admin:modify-score', args=[obj.pk]),
-            reverse('admin:set-grade', args=[obj.pk]),
-            reverse('admin:return-problem', args=[obj.pk]),
-            reverse('admin:request-duel', args=[obj.pk]),
+            *(url.replace(self.ACTION_URL_PK, str(obj.pk)) for url in self._action_url_templates())
         )
     team_actions.short_description = 'Team Actions'
     team_actions.allow_tags = True
 
+    def grade_attempts(self, request, queryset):
+        url = reverse('admin:bulk-grade', current_app=self.admin_site.name)
+        return HttpResponseRedirect(f"{url}?teams={','.join(map(str, queryset.values_list('pk', flat=True)))}")
+    grade_attempts.short_description = 'Grade attempts of selected teams'
+
+    def process_bulk_grade(self, request, *args, **kwargs):
+        team_ids = [pk for pk in request.GET.get('teams', '').split(',') if pk.isdigit()]
+
+        if request.method == 'POST':
+            form = BulkGradeForm(request.POST, team_ids=team_ids)
+            if form.is_valid():
+                try:
+                    graded = form.save()
+                except Exception as e:
+                    self.message_user(request, f'sth went wrong: {str(e)}', level=messages.ERROR)
+                else:
+                    self.message_user(request, f'Success, {len(graded)} attempts graded')
+                    url = reverse(
+                        'admin:contest_team_changelist',
+                        current_app=self.admin_site.name,
+                    )
+                    return HttpResponseRedirect(url)
+            else:
+                self.message_user(request, f"sth went wrong: {form.errors}", level=messages.ERROR)
+        else:
+            form = BulkGradeForm(team_ids=team_ids)
+
+        context = self.admin_site.each_context(request)
+        context['opts'] = self.model._meta
+        context['form'] = form
+        context['title'] = 'Grade Attempts'
+
+        return TemplateResponse(
+            request,
+            'admin/team/team_action.html',
+            context,
+        )
+
     def process_request_duel(self, request, team_id, *args, **kwargs):
         return self.process_action(
             request=request,
@@ -123,19 +216,31 @@ class TeamAdmin(admin.ModelAdmin):
         team = self.get_object(request, team_id)
 
         if request.method == 'POST':
-            form = action_form(request.POST, team_id=team_id)
+            form = action_form(request.POST, team_id=team_id, team=team)
             if form.is_valid():
+                url = reverse(
+                    'admin:contest_team_changelist',
+                    # args=[team_id],
+                    current_app=self.admin_site.name,
+                )
+                token = form.cleaned_data['idempotency_token']
+                if token:
+                    claimed, result = recent_submissions.claim(token)
+                    if not claimed:
+                        # a double click or a refresh, answer like the first submission did
+                        self.message_user(request, 'Already submitted, still in progress' if result is PENDING
+                                          else result, level=messages.WARNING)
+                        return HttpResponseRedirect(url)
                 try:
                     form.save()
                 except Exception as e:
+                    if token:
+                        recent_submissions.release(token)
                     self.message_user(request, f'sth went wrong: {str(e)}', level=messages.ERROR)
                 else:
+                    if token:
+                        recent_submissions.finish(token, f'{action_title} of {team} already done')
                     self.message_user(request, 'Success')
-                    url = reverse(
-                        'admin:contest_team_changelist',
-                        # args=[team_id],
-                        current_app=self.admin_site.name,
-                    )
                     return HttpResponseRedirect(url)
             else:
                 self.message_user(request, f"sth went wrong: {form.errors}", level=messages.ERROR)
@@ -151,7 +256,7 @@ class TeamAdmin(admin.ModelAdmin):
                     context,
                 )
 
-        form = action_form(team_id=team_id)
+        form = action_form(team_id=team_id, team=team)
         context = self.admin_site.each_context(request)
         context['opts'] = self.model._meta
         context['form'] = form
@@ -181,7 +286,11 @@ class TeamAdmin(admin.ModelAdmin):
 class DuelAdmin(admin.ModelAdmin):
     list_display = ('id', 'requested_by', 'req_returned',
                     'to', 'to_returned', 'problem', 'pending', 'type', 'winner', 'duel_actions')
-    list_filter = ('requested_by', 'to', 'pending')
+    list_filter = (('requested_by', CachedTeamFilter), ('to', CachedTeamFilter), 'pending')
+
+    def get_queryset(self, request):
+        # the teams and the problem are shown in the changelist and the set winner form
+        return super().get_queryset(request).select_related('requested_by', 'to', 'winner', 'problem')
 
     def get_urls(self):
         urls = super().get_urls()
@@ -255,13 +364,65 @@ class DuelAdmin(admin.ModelAdmin):
         )
 
 
+class KeysetChangeList(ChangeList):
+    """
+    Changelist paged by primary key, newest first: a page is the rows below the
+    `before` id, and nothing is ever counted.
+    """
+    CURSOR_VAR = 'before'
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(self.CURSOR_VAR, None)
+        return lookup_params
+
+    def get_ordering(self, request, queryset):
+        return ['-pk']
+
+    def get_results(self, request):
+        queryset = self.queryset
+        cursor = self.params.get(self.CURSOR_VAR)
+        if cursor:
+            try:
+                queryset = queryset.filter(pk__lt=int(cursor))
+            except ValueError:
+                raise IncorrectLookupParameters
+        result_list = list(queryset[:self.list_per_page + 1])
+        self.next_cursor = result_list[self.list_per_page - 1].pk if len(result_list) > self.list_per_page else None
+        self.result_list = result_list[:self.list_per_page]
+        self.result_count = len(self.result_list)
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.can_show_all = False
+        self.multi_page = bool(cursor or self.next_cursor)
+        self.paginator = None
+
+    def next_page_url(self):
+        return self.get_query_string({self.CURSOR_VAR: self.next_cursor}, [PAGE_VAR])
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[self.CURSOR_VAR, PAGE_VAR])
+
+
 @admin.register(Transaction)
-class DuelAdmin(admin.ModelAdmin):
-    list_display = ('decreased_from', 'increased_to', 'amount', 'reason', 'extra')
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'decreased_from', 'increased_to', 'amount', 'reason', 'extra')
+
+    list_select_related = ('decreased_from', 'increased_to')
 
     search_fields = ('decreased_from__name', 'increased_to__name')
 
-    list_filter = ('reason', 'decreased_from', 'increased_to')
+    list_filter = ('reason', ('decreased_from', CachedTeamFilter), ('increased_to', CachedTeamFilter))
+
+    sortable_by = ()
+
+    show_full_result_count = False
+
+    change_list_template = 'admin/contest/transaction/change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
 
 
 admin.site.register(Problem)
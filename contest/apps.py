@@ -1,5 +1,42 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps as global_apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
+
+
+def create_shekib_jib(sender, using=DEFAULT_DB_ALIAS, apps=global_apps, **kwargs):
+    """
+    Makes sure the house account exists after migrate/flush and drops the
+    memoized copy, which may point to a row that is gone.
+    """
+    from .models import Team
+
+    Team.reset_shekib_jib()
+    try:
+        HistoricalTeam = apps.get_model('contest', 'Team')
+    except LookupError:
+        return
+    HistoricalTeam._default_manager.using(using).get_or_create(
+        id=Team.SHEKIB_JIB_ID,
+        defaults={'name': 'SHEKIB_JIB', 'score': float('+inf')}
+    )
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Runs settings.SQLITE_PRAGMAS on every new sqlite connection.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
 
 
 class ContestConfig(AppConfig):
     name = 'contest'
+
+    def ready(self):
+        post_migrate.connect(create_shekib_jib, sender=self)
+        connection_created.connect(apply_sqlite_pragmas)
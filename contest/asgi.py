@@ -0,0 +1,226 @@
+"""
+ASGI application for MiniContest, see MiniContest/asgi.py.
+
+Django 2.2 speaks WSGI only, so this is a small ASGI 3 application of its
+own. The read paths viewers hammer are served on the event loop:
+
+- GET /api/scoreboard/ from the cached board, encoded once per version;
+- GET /api/scoreboard/stream/ as server-sent events, woken by the
+  scoreboard broadcaster instead of holding a thread per viewer;
+- GET /api/teams/<id>/rank/ with its ORM work on the thread pool.
+
+Everything else (the admin, writes, the other API views) goes to the regular
+Django WSGI application on the same thread pool.
+"""
+import asyncio
+import io
+import json
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections
+
+from .scoreboard import broadcaster, get_scoreboard, get_team_rank
+
+TEAM_RANK_PATH = re.compile(r'^/api/teams/(?P<pk>\d+)/rank/$')
+
+
+def _headers(content_type, extra=()):
+    # what CorsMiddleware adds to the same responses with CORS_ORIGIN_ALLOW_ALL
+    return [
+        (b'content-type', content_type),
+        (b'access-control-allow-origin', b'*'),
+        (b'access-control-expose-headers', ', '.join(settings.CORS_EXPOSE_HEADERS).encode()),
+        *extra,
+    ]
+
+
+def _encode(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+class ContestASGIApplication:
+
+    def __init__(self, threads=None):
+        self.executor = ThreadPoolExecutor(max_workers=threads or getattr(settings, 'ASGI_THREADS', 16),
+                                           thread_name_prefix='asgi-sync')
+        self.wsgi = get_wsgi_application()
+        self._board = (None, None)
+        self._changed = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        path = scope['path']
+        if scope['method'] == 'GET':
+            if path == '/api/scoreboard/' and not scope['query_string']:
+                return await self.scoreboard(send)
+            if path == '/api/scoreboard/stream/':
+                return await self.scoreboard_stream(scope, receive, send)
+            match = TEAM_RANK_PATH.match(path)
+            if match:
+                return await self.team_rank(scope, send, int(match.group('pk')))
+        return await self.django(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_sync(self, func, *args):
+        """
+        Runs blocking (ORM) code on the thread pool, like a request of the WSGI path.
+        """
+        def call():
+            try:
+                return func(*args)
+            finally:
+                close_old_connections()
+        return await asyncio.get_event_loop().run_in_executor(self.executor, call)
+
+    async def respond(self, send, status, body, content_type=b'application/json', headers=()):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': _headers(content_type, [(b'content-length', str(len(body)).encode()), *headers])})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def scoreboard(self, send):
+        # the version check (and a rebuild) needs the database, the encoded body is reused per version
+        board = await self.run_sync(get_scoreboard)
+        version, body = self._board
+        if version != board['version'] or body is None:
+            body = _encode(board['teams'])
+            self._board = (board['version'], body)
+        await self.respond(send, 200, body, headers=[(b'x-scoreboard-version', str(board['version']).encode())])
+
+    async def team_rank(self, scope, send, pk):
+        neighbours = 2
+        for name, _, value in (each.partition('=') for each in scope['query_string'].decode().split('&')):
+            if name == 'neighbours':
+                if not value.isdigit():
+                    return await self.respond(send, 400, _encode({'detail': 'neighbours must be a number'}))
+                neighbours = min(int(value), 50)
+        from .models import Team
+        try:
+            data = await self.run_sync(get_team_rank, pk, neighbours)
+        except Team.DoesNotExist:
+            return await self.respond(send, 404, _encode({'detail': 'Not found.'}))
+        await self.respond(send, 200, _encode(data))
+
+    def _wake_viewers(self, loop):
+        event = self._changed.get(loop)
+        if event is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(event.set)
+
+    async def scoreboard_stream(self, scope, receive, send):
+        """
+        The event stream of contest.views.scoreboard_stream, one coroutine per viewer.
+        """
+        loop = asyncio.get_event_loop()
+        if loop not in self._changed:
+            self._changed[loop] = asyncio.Event()
+            broadcaster.listeners.append(partial(self._wake_viewers, loop))
+        last_version = dict(scope['headers']).get(b'last-event-id', b'').decode()
+        last_version = int(last_version) if last_version.isdigit() else None
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _headers(
+            b'text/event-stream', [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+        )})
+        disconnected = asyncio.ensure_future(receive())
+        broadcaster.add_subscriber()
+        try:
+            await send({'type': 'http.response.body', 'more_body': True,
+                        'body': f"retry: {int(broadcaster.poll_interval * 1000)}\n\n".encode()})
+            while True:
+                version, message = broadcaster.version, broadcaster.message
+                if message is not None and version != last_version:
+                    last_version = version
+                    await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+                    continue
+                changed = asyncio.ensure_future(self._changed[loop].wait())
+                done, _ = await asyncio.wait((changed, disconnected), timeout=broadcaster.heartbeat,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                changed.cancel()
+                if disconnected in done:
+                    return
+                if changed in done:
+                    # every viewer of this loop has been woken, arm it for the next change
+                    self._changed[loop].clear()
+                else:
+                    await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+        finally:
+            disconnected.cancel()
+            broadcaster.remove_subscriber()
+
+    async def django(self, scope, receive, send):
+        """
+        Runs the request through the WSGI application on the thread pool.
+        """
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        loop = asyncio.get_event_loop()
+        response = await loop.run_in_executor(self.executor, self.wsgi, self.environ(scope, body), start_response)
+        try:
+            await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            chunks = iter(response)
+            while True:
+                chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                await loop.run_in_executor(self.executor, response.close)
+
+    @staticmethod
+    def environ(scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode().decode('latin-1'),
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[name] = value
+            else:
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
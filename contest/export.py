@@ -0,0 +1,47 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+LEDGER_FIELDS = ('id', 'created_at', 'decreased_from_id', 'decreased_from__name', 'increased_to_id',
+                 'increased_to__name', 'amount', 'reason', 'extra')
+LEDGER_COLUMNS = ('id', 'created_at', 'decreased_from', 'decreased_from_name', 'increased_to',
+                  'increased_to_name', 'amount', 'reason', 'extra')
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+
+def ledger_rows(chunk_size=2000):
+    """
+    The whole ledger in id order as value tuples (see LEDGER_COLUMNS), team
+    names joined in the same query and fetched `chunk_size` rows at a time.
+    """
+    from .models import Transaction
+
+    return Transaction.objects.order_by('id').values_list(*LEDGER_FIELDS).iterator(chunk_size=chunk_size)
+
+
+class _Line:
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(LEDGER_COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    for row in rows:
+        yield encoder.encode(dict(zip(LEDGER_COLUMNS, row))) + '\n'
+
+
+def export_ledger(kind, chunk_size=2000):
+    """
+    Lines of the ledger as `kind` ('csv' or 'jsonl'), generated lazily so
+    memory stays flat however long the ledger is.
+    """
+    lines = csv_lines if kind == 'csv' else jsonl_lines
+    return lines(ledger_rows(chunk_size))
@@ -1,4 +1,4 @@
-from random import randint
+from uuid import uuid4
 
 from datetimepicker.widgets import DateTimePicker
 from django import forms
@@ -7,16 +7,29 @@ from django.contrib.admin.widgets import AdminSplitDateTime
 from django.utils import timezone
 from nbformat import ValidationError
 
+from .metrics import timer
 from .models import Problem, SolvingAttempt, Team, Duel, Transaction
 
+GRADE_CHOICES = (
+    (100, 'A'),
+    (75, 'B'),
+    (50, 'C'),
+    (25, 'D'),
+    (0, 'E')
+)
+
 
 class GeneralTeamForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
+        # the caller may already have the team, e.g. the admin's get_object()
+        team = kwargs.pop('team', None)
         team_id = kwargs.pop('team_id')
         self.team_id = team_id
         super().__init__(*args, **kwargs)
-        team = Team.objects.get(id=self.team_id)
+        if team is None:
+            team = Team.objects.get(id=self.team_id)
+        self.team = team
         self.fields['team'] = forms.CharField(
             max_length=100,
             disabled=True,
@@ -27,6 +40,12 @@ class GeneralTeamForm(forms.Form):
             disabled=True,
             initial=team.score
         )
+        # sent back with the submission, a replayed one is recognized by it (see TeamAdmin.process_action)
+        self.fields['idempotency_token'] = forms.CharField(
+            widget=forms.HiddenInput,
+            required=False,
+            initial=uuid4().hex
+        )
 
 
 class RequestProblemForm(GeneralTeamForm):
@@ -85,13 +104,7 @@ class SetGradeForm(GeneralTeamForm):
                                     SolvingAttempt.objects.filter(team__in=(self.team_id, )).exclude(state='SD')))
         self.fields['problem'] = forms.ChoiceField(choices=problem_choices, required=True)
         self.fields['end_time'] = forms.DateTimeField(required=False)
-        self.fields['grade'] = forms.ChoiceField(choices=(
-            (100, 'A'),
-            (75, 'B'),
-            (50, 'C'),
-            (25, 'D'),
-            (0, 'E')
-        ), required=True)
+        self.fields['grade'] = forms.TypedChoiceField(choices=GRADE_CHOICES, coerce=int, required=True)
 
     def clean_end_time(self):
         end_time = self.cleaned_data.get('end_time')
@@ -107,6 +120,31 @@ class SetGradeForm(GeneralTeamForm):
         sattp.save(cal_reward=True)
 
 
+class BulkGradeForm(forms.Form):
+
+    def __init__(self, *args, **kwargs):
+        team_ids = kwargs.pop('team_ids', None)
+        super().__init__(*args, **kwargs)
+        attempts = SolvingAttempt.objects.exclude(state='SD').select_related('team', 'problem')\
+            .order_by('team__name', 'problem_id')
+        if team_ids:
+            attempts = attempts.filter(team_id__in=team_ids)
+        self.attempts = {}
+        for attempt in attempts:
+            name = f'grade_{attempt.pk}'
+            self.attempts[name] = attempt
+            self.fields[name] = forms.ChoiceField(choices=((None, '----'), ) + GRADE_CHOICES, required=False,
+                                                  label=str(attempt))
+        self.fields['end_time'] = forms.DateTimeField(required=False)
+
+    def save(self):
+        return SolvingAttempt.objects.grade_many(
+            ((attempt.team_id, attempt.problem_id, self.cleaned_data[name])
+             for name, attempt in self.attempts.items() if self.cleaned_data[name] != ''),
+            end_time=self.cleaned_data['end_time']
+        )
+
+
 class ChangeScore(GeneralTeamForm):
 
     def __init__(self, *args, **kwargs):
@@ -122,14 +160,12 @@ class ChangeScore(GeneralTeamForm):
         return s
 
     def save(self):
-        team = Team.objects.get(id=self.team_id)
         amount = self.cleaned_data['change_score']
         reason = self.cleaned_data['reason']
         extra = self.cleaned_data['extra']
-        team.score += amount
-        Transaction.objects.create(decreased_from=Team.SHEKIB_JIB, increased_to=team, amount=amount,
-                                   reason=reason, extra=extra)
-        team.save()
+        with timer('score_change'):
+            # the loaded score and version are the first guess of change_scores()
+            return Transaction.objects.transfer(Team.SHEKIB_JIB, self.team, amount, reason, extra=extra)
 
 
 class RequestForDuelForm(GeneralTeamForm):
@@ -138,7 +174,7 @@ class RequestForDuelForm(GeneralTeamForm):
         super().__init__(*args, **kwargs)
         to_teams = list(map(
             lambda t: (t.id, str(t)),
-            filter(lambda t: t.current_duels_count() == 0, Team.objects.all().exclude(id=self.team_id))
+            self.free_teams().only('id', 'name')
         ))
         to_teams.insert(0, (None, '----'))
         problem_choices = list(map(
@@ -153,12 +189,16 @@ class RequestForDuelForm(GeneralTeamForm):
             choices=map(lambda it: (it[0], it[1]['display_name']), Duel.TYPES.items())
         )
 
+    def free_teams(self):
+        return Team.objects.free_for_duel().exclude(id=self.team_id)
+
     def clean_to_team(self):
         to_team = self.cleaned_data['to_team']
         if not to_team:
-            to_teams = list(filter(lambda t: t.current_duels_count() == 0, Team.objects.exclude(id=self.team_id)))
-            l = len(to_teams)
-            to_team = to_teams[randint(0, l-1)]
+            # picked by the database, so only one team is loaded
+            to_team = self.free_teams().order_by('?').first()
+            if to_team is None:
+                raise forms.ValidationError("There is no team free for a duel right now")
         else:
             to_team = Team.objects.get(id=to_team)
         return to_team
@@ -166,16 +206,19 @@ class RequestForDuelForm(GeneralTeamForm):
     def clean_problem(self):
         problem = self.cleaned_data['problem']
         if not problem:
-            problems = Problem.objects.filter(type='D').exclude(
-                duel__requested_by__in=(self.team_id, self.cleaned_data['to_team']),
-                duel__to__in=(self.team_id, self.cleaned_data['to_team']))
-            l = len(problems)
-            problem = problems[randint(0, l-1)]
+            to_team = self.cleaned_data.get('to_team')
+            problem = Problem.objects.filter(type='D').exclude(
+                duel__requested_by__in=(self.team_id, to_team),
+                duel__to__in=(self.team_id, to_team)).order_by('?').first()
+            if problem is None:
+                raise forms.ValidationError("There is no duel problem left for these teams")
+        else:
+            problem = Problem.objects.get(id=problem)
         return problem
 
     def save(self):
         d = Duel(
-            requested_by_id=self.team_id,
+            requested_by_id=int(self.team_id),
             to=self.cleaned_data['to_team'],
             problem=self.cleaned_data['problem'],
             type=self.cleaned_data['type']
@@ -190,23 +233,20 @@ class SetDuelWinner(forms.Form):
         duel = kwargs.pop('duel')
         self.duel = duel
         super().__init__(*args, **kwargs)
+        requested_by = (duel.requested_by_id, str(duel.requested_by))
+        to = (duel.to_id, str(duel.to))
         self.fields['requested_by'] = forms.ChoiceField(
-            choices=((duel.requested_by.id, str(duel.requested_by)), ),
+            choices=(requested_by, ),
             disabled=True,
             required=False
         )
         self.fields['to'] = forms.ChoiceField(
-            choices=((duel.to.id, str(duel.to)), ),
+            choices=(to, ),
             disabled=True,
             required=False
         )
         self.fields['type'] = forms.CharField(initial=duel.get_type_display(), disabled=True, required=False)
-        self.fields['winner'] = forms.ChoiceField(
-            choices=(
-                (duel.requested_by.id, str(duel.requested_by)),
-                (duel.to.id, str(duel.to))
-            )
-        )
+        self.fields['winner'] = forms.ChoiceField(choices=(requested_by, to))
 
     def clean_winner(self):
         return int(self.cleaned_data['winner'])
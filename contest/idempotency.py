@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.cache import cache
+
+# the result of a token whose submission is still running
+PENDING = None
+
+
+class RecentTokens:
+    """
+    Submission tokens and their results, kept in the configured cache for
+    `timeout` seconds, so a replayed form submission is answered without saving
+    again. Tokens are claimed with cache.add(), which is atomic within a cache:
+    with the default local memory cache that is one process, other workers only
+    see the tokens claimed through a shared backend (memcached, redis, database).
+    """
+    KEY_PREFIX = 'contest:idempotency:'
+
+    def __init__(self, timeout=3600):
+        self.timeout = timeout
+
+    def claim(self, token):
+        """
+        (True, None) when `token` is new and now reserved for the caller, otherwise
+        (False, result of the first submission), PENDING while it is still running.
+        """
+        key = self.KEY_PREFIX + token
+        if cache.add(key, PENDING, self.timeout):
+            return True, None
+        return False, cache.get(key)
+
+    def finish(self, token, result):
+        cache.set(self.KEY_PREFIX + token, result, self.timeout)
+
+    def release(self, token):
+        """
+        Forgets a claimed token whose submission failed, so it can be tried again.
+        """
+        cache.delete(self.KEY_PREFIX + token)
+
+
+recent_submissions = RecentTokens(getattr(settings, 'ADMIN_IDEMPOTENCY_TIMEOUT', 3600))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from contest.models import ScoreCheckpoint
+
+
+class Command(BaseCommand):
+    help = ('Snapshots every team\'s score each --every ledger entries, so point-in-time scoreboards '
+            'replay at most that many entries; run it periodically while the contest goes on')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        taken = ScoreCheckpoint.objects.take(every=options['every'])
+        if options['verbosity']:
+            self.stdout.write(f"{taken} checkpoints taken")
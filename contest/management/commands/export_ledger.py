@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from contest.export import EXPORT_FORMATS, export_ledger
+
+
+class Command(BaseCommand):
+    help = 'Writes the whole Transaction ledger as CSV or JSON lines, streamed in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+        parser.add_argument('--output', help='file to write to, standard output by default')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        lines = export_ledger(options['format'], chunk_size=options['chunk_size'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            output.writelines(lines)
@@ -0,0 +1,162 @@
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from contest.models import Problem, ProblemStatistics, Team, SolvingAttempt, Duel, Transaction
+from contest.scoreboard import invalidate_scoreboard
+
+
+def bulk_insert(model, objs, batch_size):
+    """
+    bulk_create() that only keeps `batch_size` unsaved objects in memory at a time.
+    """
+    objs = iter(objs)
+    count = 0
+    while True:
+        batch = list(islice(objs, batch_size))
+        if not batch:
+            return count
+        model.objects.bulk_create(batch)
+        count += len(batch)
+
+
+def bulk_insert_rows(model, fields, rows, batch_size):
+    """
+    Inserts plain value tuples with executemany(), skipping model instances
+    altogether; used for the ledger, which can run into millions of rows.
+    """
+    opts = model._meta
+    columns = [opts.get_field(field).column for field in fields]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(opts.db_table),
+        ', '.join(map(connection.ops.quote_name, columns)),
+        ', '.join(['%s'] * len(columns))
+    )
+    rows = iter(rows)
+    count = 0
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return count
+            cursor.executemany(sql, batch)
+            count += len(batch)
+
+
+class Command(BaseCommand):
+    help = 'Fills the database with a synthetic contest, for load tests and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teams', type=int, default=100)
+        parser.add_argument('--problems', type=int, default=50, help='a tenth of them are duel problems')
+        parser.add_argument('--attempts', type=int, default=1000)
+        parser.add_argument('--duels', type=int, default=200)
+        parser.add_argument('--transactions', type=int, default=5000,
+                            help='ledger size, at least one row per attempt, graded attempt and duel')
+        parser.add_argument('--duration', type=float, default=4, help='contest length in hours')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        end = timezone.now()
+        start = end - timedelta(hours=options['duration'])
+
+        def moment(progress):
+            return start + (end - start) * progress
+
+        with transaction.atomic():
+            first_problem = (Problem.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+            problems = [
+                Problem(id=first_problem + i, level=rnd.choice(tuple(Problem.LEVELS)), type='D' if i % 10 == 9 else 'P')
+                for i in range(options['problems'])
+            ]
+            Problem.objects.bulk_create(problems)
+            solving_problems = [problem for problem in problems if problem.type == 'P']
+            duel_problems = [problem for problem in problems if problem.type == 'D']
+
+            last_team = Team.objects.aggregate(last=Max('id'))['last'] or 0
+            bulk_insert(Team, (Team(name=f'team-{last_team + i + 1}') for i in range(options['teams'])), batch_size)
+            teams = list(Team.objects.filter(id__gt=last_team).values_list('id', flat=True))
+            scores = dict.fromkeys(teams, 500.0)
+            house = Team.SHEKIB_JIB.id
+
+            # ledger entries as (progress, decreased_from, increased_to, amount, reason, extra)
+            ledger = []
+            attempts = self.attempts(rnd, teams, solving_problems, options['attempts'], moment, ledger)
+            attempts = bulk_insert(SolvingAttempt, attempts, batch_size)
+            duels = self.duels(rnd, teams, duel_problems, options['duels'], ledger)
+            ledger.extend(
+                (rnd.random(), house, rnd.choice(teams), float(rnd.randint(-50, 100)), Transaction.MAFIA, None)
+                for _ in range(options['transactions'] - len(ledger))
+            )
+            ledger.sort(key=lambda entry: entry[0])
+
+            def rows():
+                for progress, decreased_from, increased_to, amount, reason, extra in ledger:
+                    if reason == Transaction.DUEL:
+                        duel = extra
+                        loser = duel.to_id if duel.winner_id == duel.requested_by_id else duel.requested_by_id
+                        decreased_from, increased_to = loser, duel.winner_id
+                        amount = scores[loser] * Duel.TYPES[duel.type]['factor']
+                        extra = f'problem -> {str(duel.problem)}'
+                    if decreased_from != house:
+                        scores[decreased_from] -= amount
+                    if increased_to != house:
+                        scores[increased_to] += amount
+                    yield (decreased_from, increased_to, amount, reason, extra,
+                           connection.ops.adapt_datetimefield_value(moment(progress)))
+
+            bulk_insert(Duel, duels, batch_size)
+            fields = ('decreased_from', 'increased_to', 'amount', 'reason', 'extra', 'created_at')
+            transactions = bulk_insert_rows(Transaction, fields, rows(), batch_size)
+            Team.objects.bulk_update([Team(id=pk, score=score, version=1) for pk, score in scores.items()],
+                                     ('score', 'version'))
+            ProblemStatistics.objects.rebuild()
+            invalidate_scoreboard()
+        if options['verbosity']:
+            self.stdout.write(f"{len(teams)} teams, {len(problems)} problems, {attempts} attempts, "
+                              f"{len(duels)} duels, {transactions} transactions")
+
+    def attempts(self, rnd, teams, problems, count, moment, ledger):
+        house = Team.SHEKIB_JIB.id
+        count = min(count, len(teams) * len(problems))
+        pairs = rnd.sample(range(len(teams) * len(problems)), count)
+        # only the last attempt of a team may still be in progress
+        last_of_team = {}
+        for pair in sorted(pairs):
+            last_of_team[pair // len(problems)] = pair
+        for pair in pairs:
+            team, problem = teams[pair // len(problems)], problems[pair % len(problems)]
+            level = Problem.LEVELS[problem.level]
+            cost = rnd.randint(level['min_cost'], level['max_cost'])
+            begin = rnd.uniform(0, 0.9)
+            state = rnd.choice(('S', 'C', 'SD')) if last_of_team[pair // len(problems)] == pair else 'SD'
+            grade = rnd.choice((0, 25, 50, 75, 100)) if state == 'SD' else None
+            finish = begin + rnd.uniform(0.01, 0.1) if state != 'S' else None
+            ledger.append((begin, team, house, float(cost), Transaction.PROBLEM_REQ, None))
+            if state == 'SD':
+                ledger.append((finish, house, team, problem.calculate_reward(cost, grade), Transaction.PROBLEM_SLV,
+                               None))
+            yield SolvingAttempt(team_id=team, problem_id=problem.id, cost=cost, state=state, grade=grade,
+                                 start_time=moment(begin), end_time=moment(finish) if finish else None)
+
+    def duels(self, rnd, teams, problems, count, ledger):
+        duels = []
+        if not problems or len(teams) < 2:
+            return duels
+        for _ in range(count):
+            requested_by, to = rnd.sample(teams, 2)
+            duel = Duel(requested_by_id=requested_by, to_id=to, problem=rnd.choice(problems),
+                        type=rnd.choice(tuple(Duel.TYPES)), winner_id=rnd.choice((requested_by, to)),
+                        pending=False, req_returned=True, to_returned=True)
+            duels.append(duel)
+            # teams and amount are filled in once the loser's score at that point is known
+            ledger.append((rnd.random(), None, None, 0, Transaction.DUEL, duel))
+        return duels
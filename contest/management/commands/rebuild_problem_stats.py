@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from contest.models import ProblemStatistics
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the per problem statistics from the attempts, after bulk imports or '
+            'deleting attempts outside the admin forms')
+
+    def handle(self, *args, **options):
+        rebuilt = ProblemStatistics.objects.rebuild()
+        if options['verbosity']:
+            self.stdout.write(f"{rebuilt} problems")
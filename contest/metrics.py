@@ -0,0 +1,153 @@
+"""
+In-process request and operation metrics, exposed in the Prometheus text format.
+
+Everything here is off unless settings.CONTEST_METRICS is set: the middleware
+then removes itself from the stack and timer() hands out a shared no-op.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def enabled():
+    return settings.CONTEST_METRICS
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float('inf') else '+Inf'
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, labels, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for ind, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][ind] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = sorted((key, ([*counts], total, count)) for key, (counts, total, count) in self.series.items())
+        for label_values, (counts, total, count) in series:
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labels, label_values))
+            for bound, bucket_count in zip(self.buckets + (float('inf'), ), counts + [count]):
+                yield f'{self.name}_bucket{{{labels}{"," if labels else ""}le="{_format_value(bound)}"}} {bucket_count}'
+            yield f'{self.name}_sum{{{labels}}} {_format_value(total)}'
+            yield f'{self.name}_count{{{labels}}} {count}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_DURATION = Histogram('contest_request_duration_seconds', 'Time to build the response of a request.',
+                             ('endpoint', 'method'), SECONDS_BUCKETS)
+REQUEST_QUERIES = Histogram('contest_request_db_queries', 'Database queries run by a request.',
+                            ('endpoint', 'method'), QUERY_BUCKETS)
+REQUEST_DB_DURATION = Histogram('contest_request_db_duration_seconds', 'Time a request spent in the database.',
+                                ('endpoint', 'method'), SECONDS_BUCKETS)
+OPERATION_DURATION = Histogram('contest_operation_duration_seconds',
+                               'Time of a score changing operation, e.g. purchase, grade or duel.',
+                               ('operation', ), SECONDS_BUCKETS)
+METRICS = (REQUEST_DURATION, REQUEST_QUERIES, REQUEST_DB_DURATION, OPERATION_DURATION)
+
+
+def render():
+    return '\n'.join(line for metric in METRICS for line in metric.render()) + '\n'
+
+
+@contextmanager
+def _timer(operation):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        OPERATION_DURATION.observe(time.perf_counter() - start, operation)
+
+
+class _NoTimer:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+def timer(operation):
+    """
+    Context manager recording how long `operation` takes, a no-op while metrics are off.
+    """
+    if not enabled():
+        return _NO_TIMER
+    return _timer(operation)
+
+
+def endpoint_of(request):
+    """
+    Bounded label for a request: the url name when there is one, otherwise its route.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name if match.url_name else match.route
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count and database time of every request by endpoint.
+    """
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        database = [0, 0.0]
+
+        def measure_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                database[0] += 1
+                database[1] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(measure_query):
+            response = self.get_response(request)
+        labels = (endpoint_of(request), request.method)
+        REQUEST_DURATION.observe(time.perf_counter() - start, *labels)
+        REQUEST_QUERIES.observe(database[0], *labels)
+        REQUEST_DB_DURATION.observe(database[1], *labels)
+        return response
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0004_transaction_extra'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreboardVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0005_scoreboardversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='duel',
+            index=models.Index(fields=['to', 'to_returned'], name='duel_to_returned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='duel',
+            index=models.Index(fields=['requested_by', 'req_returned'], name='duel_req_returned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solvingattempt',
+            index=models.Index(fields=['team', 'state'], name='attempt_team_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['-score'], name='team_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['decreased_from', 'reason'], name='transaction_dec_reason_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['increased_to', 'reason'], name='transaction_inc_reason_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0006_indexes'),
+    ]
+
+    operations = [
+        # existing entries have no known time and are left NULL, only new ones get the default
+        migrations.AddField(
+            model_name='transaction',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='created_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScoreCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('last_transaction_id', models.IntegerField(db_index=True)),
+                ('time', models.DateTimeField(db_index=True, null=True)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='contest.Team')),
+            ],
+        ),
+    ]
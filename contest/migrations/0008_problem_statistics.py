@@ -0,0 +1,47 @@
+# Generated by Django 2.2.28 on 2026-10-17 00:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_statistics(apps, schema_editor):
+    ProblemStatistics = apps.get_model('contest', 'ProblemStatistics')
+    SolvingAttempt = apps.get_model('contest', 'SolvingAttempt')
+    fields = {'S': 'solving', 'C': 'checking', 'SD': 'solved'}
+    rows = {}
+    for attempt in SolvingAttempt.objects.iterator():
+        row = rows.setdefault(attempt.problem_id, ProblemStatistics(problem_id=attempt.problem_id))
+        row.attempts += 1
+        setattr(row, fields[attempt.state], getattr(row, fields[attempt.state]) + 1)
+        row.cost_total += attempt.cost
+        if attempt.state == 'SD':
+            row.grade_total += attempt.grade or 0
+        if attempt.end_time:
+            row.finished += 1
+            row.duration_total += (attempt.end_time - attempt.start_time).total_seconds()
+    ProblemStatistics.objects.bulk_create(rows.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0007_transaction_time_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemStatistics',
+            fields=[
+                ('problem', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='statistics', serialize=False, to='contest.Problem')),
+                ('attempts', models.IntegerField(default=0)),
+                ('solving', models.IntegerField(default=0)),
+                ('checking', models.IntegerField(default=0)),
+                ('solved', models.IntegerField(default=0)),
+                ('finished', models.IntegerField(default=0)),
+                ('grade_total', models.IntegerField(default=0)),
+                ('cost_total', models.IntegerField(default=0)),
+                ('duration_total', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-17 01:18
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def fill_opening_scores(apps, schema_editor):
+    # what the ledger has not moved yet of the current score
+    Team = apps.get_model('contest', 'Team')
+    Transaction = apps.get_model('contest', 'Transaction')
+    increased = dict(Transaction.objects.order_by().values_list('increased_to').annotate(total=Sum('amount')))
+    decreased = dict(Transaction.objects.order_by().values_list('decreased_from').annotate(total=Sum('amount')))
+    teams = list(Team.objects.filter(id__gte=0).only('id', 'score'))
+    for team in teams:
+        team.opening_score = team.score - increased.get(team.id, 0) + decreased.get(team.id, 0)
+    Team.objects.bulk_update(teams, ('opening_score', ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0009_team_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='opening_score',
+            field=models.FloatField(default=500, editable=False),
+        ),
+        migrations.RunPython(fill_opening_scores, migrations.RunPython.noop),
+    ]
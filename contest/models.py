@@ -1,11 +1,21 @@
+from collections import defaultdict
+from contextlib import nullcontext
 from datetime import timedelta
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Case, Count, DurationField, ExpressionWrapper, F, Func, OuterRef, Q, Subquery,
+                              Sum, Value, When, Window)
+from django.db.models.functions import Coalesce, Rank
 from django.utils import timezone
 
+from contest.metrics import timer
+from contest.scoreboard import invalidate_scoreboard, invalidate_team
 from contest.utils import classproperty
+from contest.writer import serialized_write
 
 
 class Problem(models.Model):
@@ -54,7 +64,53 @@ class Problem(models.Model):
         return f"{self.type}-{self.id}({self.level_display()})"
 
 
-class TeamManager(models.Manager):
+def _count_subquery(queryset, team_field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{team_field: OuterRef('pk')}).order_by().values(team_field)
+            .annotate(count=Count('pk')).values('count'),
+            output_field=models.IntegerField()
+        ),
+        0
+    )
+
+
+class TeamQuerySet(models.QuerySet):
+
+    def with_stats(self):
+        """
+        Annotates `current_duels` and `solved_count`, the values of
+        Team.current_duels_count() and Team.solved_problems, in the same query.
+        """
+        return self.annotate(
+            current_duels=(_count_subquery(Duel.objects.filter(to_returned=False), 'to') +
+                           _count_subquery(Duel.objects.filter(req_returned=False), 'requested_by')),
+            solved_count=_count_subquery(SolvingAttempt.objects.filter(state='SD'), 'team'),
+        )
+
+    def ranked(self):
+        """
+        Annotates `rank` with a RANK() window over score, tied teams share a rank.
+        """
+        return self.annotate(rank=Window(Rank(), order_by=F('score').desc())).order_by('-score', 'id')
+
+    def with_rank(self):
+        """
+        Annotates the same `rank` as ranked(), as one plus the number of teams with
+        a higher score. Unlike a window it stays right on a filtered queryset.
+        """
+        higher = Team.objects.filter(score__gt=OuterRef('score')).order_by()\
+            .annotate(count=Func(F('pk'), function='COUNT')).values('count')
+        return self.annotate(rank=Subquery(higher, output_field=models.IntegerField()) + 1)
+
+    def free_for_duel(self):
+        """
+        Teams with no unreturned duel, i.e. current_duels_count() == 0.
+        """
+        return self.exclude(duel__to_returned=False).exclude(duel_request__req_returned=False)
+
+
+class TeamManager(models.Manager.from_queryset(TeamQuerySet)):
 
     def get_queryset(self):
         return super().get_queryset().exclude(id__lt=0)
@@ -62,16 +118,75 @@ class TeamManager(models.Manager):
 
 class Team(models.Model):
 
+    INITIAL_SCORE = 500
+
     name = models.TextField()
-    score = models.FloatField(default=500)
+    score = models.FloatField(default=INITIAL_SCORE)
+    # the score the team was created with, point-in-time scoreboards replay the ledger from it
+    opening_score = models.FloatField(default=INITIAL_SCORE, editable=False)
+    # bumped by every score change, which is conditional on it (see change_scores())
+    version = models.PositiveIntegerField(default=0, editable=False)
     problems = models.ManyToManyField(Problem, through='SolvingAttempt', related_name='teams',
                                       related_query_name='team')
 
     objects = TeamManager()
     allobjs = models.Manager()
 
+    SHEKIB_JIB_ID = -1
+    _shekib_jib = None
+
+    CHOICES_CACHE_KEY = 'contest:team-choices'
+
     class Meta:
         ordering = ('-score', )
+        indexes = (
+            models.Index(fields=('-score', ), name='team_score_idx'),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_score = instance.__dict__.get('score')
+        return instance
+
+    def _set_score(self, score, version):
+        self.score = self._loaded_score = score
+        self.version = version
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.opening_score = self.score
+            super().save(*args, **kwargs)
+            self._loaded_score = self.score
+        else:
+            # other fields are saved as usual, while a changed score is applied through change_scores()
+            # as the difference to the loaded one, so score changes made meanwhile are not overwritten
+            update_fields = kwargs.pop('update_fields', None)
+            if update_fields is None:
+                # like a regular save, fields that were not loaded are not written
+                deferred = self.get_deferred_fields()
+                update_fields = [field.name for field in self._meta.concrete_fields
+                                 if not field.primary_key and field.attname not in deferred]
+            fields = [name for name in update_fields if name not in ('score', 'version')]
+            loaded = getattr(self, '_loaded_score', None)
+            change = self.score - loaded if 'score' in update_fields and loaded is not None else 0
+            with transaction.atomic():
+                if fields:
+                    super().save(*args, update_fields=fields, **kwargs)
+                if change:
+                    self.score = loaded
+                    change_scores((self, ), lambda scores: {self.pk: change})
+        cache.delete(Team.CHOICES_CACHE_KEY)
+        invalidate_team(self.pk)
+        invalidate_scoreboard()
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        cache.delete(Team.CHOICES_CACHE_KEY)
+        invalidate_team(pk)
+        invalidate_scoreboard()
+        return result
 
     def clean(self):
         if self.score < 0:
@@ -99,10 +214,85 @@ class Team(models.Model):
 
     @classproperty
     def SHEKIB_JIB(self):
-        try:
-            return Team.allobjs.get(id=-1)
-        except Team.DoesNotExist:
-            return Team.allobjs.create(id=-1, name='SHEKIB_JIB', score=float('+inf'))
+        if Team._shekib_jib is None:
+            Team._shekib_jib, _ = Team.allobjs.get_or_create(
+                id=Team.SHEKIB_JIB_ID,
+                defaults={'name': 'SHEKIB_JIB', 'score': float('+inf')}
+            )
+        return Team._shekib_jib
+
+    @classmethod
+    def choices(cls):
+        """
+        (id, str(team)) of every team including the house account, by name;
+        cached until a team is saved or deleted, or for five minutes at most.
+        """
+        choices = cache.get(cls.CHOICES_CACHE_KEY)
+        if choices is None:
+            choices = [(team.pk, str(team)) for team in cls.allobjs.order_by('name').only('id', 'name')]
+            cache.set(cls.CHOICES_CACHE_KEY, choices, 5 * 60)
+        return choices
+
+    @classmethod
+    def opening_scores(cls):
+        """
+        opening_score of every team (not the house account) by id.
+        """
+        return dict(cls.objects.order_by().values_list('pk', 'opening_score'))
+
+    @classmethod
+    def reset_shekib_jib(cls):
+        """
+        Forgets the memoized house account, it is loaded again on next access.
+        """
+        cls._shekib_jib = None
+
+
+class SolvingAttemptManager(models.Manager):
+
+    @serialized_write
+    def grade_many(self, grades, end_time=None):
+        """
+        Grades many attempts at once. `grades` is an iterable of
+        (team_id, problem_id, grade); all rewards are paid in one transaction
+        through Transaction.objects.transfer_many(). Returns (attempt, reward) pairs.
+        """
+        grades = {(int(team_id), int(problem_id)): int(grade) for team_id, problem_id, grade in grades}
+        attempts = {
+            (attempt.team_id, attempt.problem_id): attempt
+            for attempt in self.filter(team_id__in={key[0] for key in grades},
+                                       problem_id__in={key[1] for key in grades}).select_related('problem')
+        }
+        missing = [key for key in grades if key not in attempts or attempts[key].state == 'SD']
+        if missing:
+            raise ValidationError(f"There is no ungraded attempt for (team, problem) {missing}")
+
+        end_time = end_time or timezone.now()
+        house = Team.SHEKIB_JIB
+        graded = []
+        records = []
+        counted = []
+        for key, grade in grades.items():
+            attempt = attempts[key]
+            counted.append(attempt.counted_before())
+            attempt.grade = grade
+            attempt.end_time = attempt.end_time or end_time
+            attempt.state = 'SD'
+            reward = attempt.problem.calculate_reward(attempt.cost, grade)
+            graded.append((attempt, reward))
+            records.append(Transaction(decreased_from=house, increased_to_id=attempt.team_id, amount=reward,
+                                       reason=Transaction.PROBLEM_SLV))
+        with timer('bulk_grade'), transaction.atomic():
+            # claim first: the write takes sqlite's lock, and a concurrent grading makes the count fall short
+            claimed = self.filter(pk__in=[attempt.pk for attempt, _ in graded]).exclude(state='SD').update(state='SD')
+            if claimed != len(graded):
+                raise ValidationError("Some of these attempts were graded meanwhile, please try again")
+            self.bulk_update([attempt for attempt, _ in graded], ('grade', 'end_time', 'state'))
+            Transaction.objects.transfer_many(records)
+            ProblemStatistics.objects.record(*zip(counted, (attempt.counted() for attempt, _ in graded)))
+        for attempt, _ in graded:
+            attempt._counted = attempt.counted()
+        return graded
 
 
 class SolvingAttempt(models.Model):
@@ -119,26 +309,84 @@ class SolvingAttempt(models.Model):
     grade = models.IntegerField(validators=(MinValueValidator(0), MaxValueValidator(100)), null=True, blank=True)
     state = models.CharField(default='S', max_length=2, choices=STATES, blank=True)
 
+    objects = SolvingAttemptManager()
+
     class Meta:
         unique_together = (('team', 'problem'), )
+        indexes = (
+            models.Index(fields=('team', 'state'), name='attempt_team_state_idx'),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields():
+            instance._counted = instance.counted()
+        return instance
+
+    def counted(self):
+        """
+        (problem id, {field: value}) of what this attempt adds to its
+        problem's ProblemStatistics row.
+        """
+        counts = {'attempts': 1, ProblemStatistics.STATE_FIELDS[self.state]: 1, 'cost_total': self.cost}
+        if self.state == 'SD':
+            counts['grade_total'] = int(self.grade or 0)
+        if self.end_time:
+            counts['finished'] = 1
+            counts['duration_total'] = self.duration.total_seconds()
+        return self.problem_id, counts
+
+    def counted_before(self):
+        """
+        counted() as of the last load or save, None for an attempt not saved yet.
+        """
+        if self._state.adding:
+            return None
+        if not hasattr(self, '_counted'):
+            # loaded with deferred fields
+            self._counted = SolvingAttempt.objects.get(pk=self.pk).counted()
+        return self._counted
 
+    @serialized_write
     def save(self, *args, **kwargs):
         cal_reward = kwargs.pop('cal_reward', False)
         buy_problem = kwargs.pop('buy_problem', False)
+        counted = self.counted_before()
+        if not (buy_problem or cal_reward):
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                ProblemStatistics.objects.record((counted, self.counted()))
+            self._counted = self.counted()
+            invalidate_team(self.team_id)
+            return
         if buy_problem:
             self.problem.validate_cost(self.cost)
-            self.team.can_request_problem()
-            self.team.score -= self.cost
-            self.team.save()
-            Transaction.objects.create(decreased_from=self.team, increased_to=Team.SHEKIB_JIB, amount=self.cost,
-                                       reason=Transaction.PROBLEM_REQ)
-        if cal_reward:
-            price = self.problem.calculate_reward(self.cost, int(self.grade))
-            self.team.score += price
-            Transaction.objects.create(decreased_from=Team.SHEKIB_JIB, increased_to=self.team, amount=price,
-                                       reason=Transaction.PROBLEM_SLV)
-            self.team.save()
-        super().save(*args, **kwargs)
+        # loaded (the house memoized) here, so neither opens the transaction with a read on sqlite
+        house = Team.SHEKIB_JIB
+        team = self.team
+        with timer('purchase' if buy_problem else 'grade'), transaction.atomic():
+            if buy_problem:
+                # charge first: the write serializes concurrent purchases before the active problems check
+                Transaction.objects.transfer(team, house, self.cost, Transaction.PROBLEM_REQ)
+                team.can_request_problem()
+            if cal_reward:
+                if self.pk and not SolvingAttempt.objects.filter(pk=self.pk).exclude(state='SD').update(state='SD'):
+                    raise ValidationError(f"{str(self)} is already graded")
+                self.state = 'SD'
+                price = self.problem.calculate_reward(self.cost, int(self.grade))
+                Transaction.objects.transfer(house, team, price, Transaction.PROBLEM_SLV)
+            super().save(*args, **kwargs)
+            ProblemStatistics.objects.record((counted, self.counted()))
+        self._counted = self.counted()
+
+    def delete(self, *args, **kwargs):
+        counted = self.counted_before()
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            ProblemStatistics.objects.record((counted, None))
+        invalidate_team(self.team_id)
+        return deleted
 
     @property
     def duration(self):
@@ -151,6 +399,98 @@ class SolvingAttempt(models.Model):
         return f'{str(self.problem)} of {str(self.team)} for {self.cost}'
 
 
+class ProblemStatisticsManager(models.Manager):
+
+    def record(self, *changes):
+        """
+        Applies attempt changes, (before, after) pairs of SolvingAttempt.counted()
+        where None stands for no attempt, as F() increments to the rows of their
+        problems; rows missing so far are created.
+        """
+        deltas = defaultdict(lambda: defaultdict(int))
+        for before, after in changes:
+            for counted, sign in ((before, -1), (after, 1)):
+                if counted is not None:
+                    problem_id, counts = counted
+                    for field, value in counts.items():
+                        deltas[problem_id][field] += sign * value
+        for problem_id, delta in deltas.items():
+            increments = {field: F(field) + value for field, value in delta.items() if value}
+            if increments and not self.filter(problem_id=problem_id).update(**increments):
+                self.get_or_create(problem_id=problem_id)
+                self.filter(problem_id=problem_id).update(**increments)
+
+    def rebuild(self):
+        """
+        Recomputes every problem's row from the attempts in one grouped query,
+        for rows that went stale through bulk inserts or queryset deletes.
+        Returns the number of rows.
+        """
+        finished = Q(solvingattempt__end_time__isnull=False)
+        duration = ExpressionWrapper(F('solvingattempt__end_time') - F('solvingattempt__start_time'),
+                                     output_field=DurationField())
+        rows = Problem.objects.order_by().annotate(
+            attempts=Count('solvingattempt'),
+            **{field: Count('solvingattempt', filter=Q(solvingattempt__state=state))
+               for state, field in ProblemStatistics.STATE_FIELDS.items()},
+            finished=Count('solvingattempt', filter=finished),
+            grade_total=Sum('solvingattempt__grade', filter=Q(solvingattempt__state='SD')),
+            cost_total=Sum('solvingattempt__cost'),
+            duration=Sum(duration, filter=finished),
+        ).filter(attempts__gt=0)
+        statistics = [
+            ProblemStatistics(problem_id=problem.id, attempts=problem.attempts, solving=problem.solving,
+                              checking=problem.checking, solved=problem.solved, finished=problem.finished,
+                              grade_total=problem.grade_total or 0, cost_total=problem.cost_total or 0,
+                              duration_total=problem.duration.total_seconds() if problem.duration else 0)
+            for problem in rows
+        ]
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(statistics)
+        return len(statistics)
+
+
+class ProblemStatistics(models.Model):
+    """
+    Running totals of a problem's attempts, kept up to date by SolvingAttempt
+    saves and deletes so the problem board reads one row per problem.
+    """
+    STATE_FIELDS = {'S': 'solving', 'C': 'checking', 'SD': 'solved'}
+
+    problem = models.OneToOneField(Problem, on_delete=models.CASCADE, primary_key=True, related_name='statistics')
+    attempts = models.IntegerField(default=0)
+    solving = models.IntegerField(default=0)
+    checking = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+    # attempts with an end time, i.e. returned or solved
+    finished = models.IntegerField(default=0)
+    grade_total = models.IntegerField(default=0)
+    cost_total = models.IntegerField(default=0)
+    duration_total = models.FloatField(default=0)
+
+    objects = ProblemStatisticsManager()
+
+    @property
+    def solve_rate(self):
+        return self.solved / self.attempts if self.attempts else None
+
+    @property
+    def average_grade(self):
+        return self.grade_total / self.solved if self.solved else None
+
+    @property
+    def average_cost(self):
+        return self.cost_total / self.attempts if self.attempts else None
+
+    @property
+    def average_duration(self):
+        """
+        Mean SolvingAttempt.duration of the finished attempts, in seconds.
+        """
+        return self.duration_total / self.finished if self.finished else None
+
+
 class Duel(models.Model):
     TYPES = {
         '1': {
@@ -179,47 +519,168 @@ class Duel(models.Model):
                             choices=map(lambda it: (it[0], it[1]['display_name']), TYPES.items()))
     pending = models.BooleanField(default=True, blank=True)
 
+    class Meta:
+        indexes = (
+            models.Index(fields=('to', 'to_returned'), name='duel_to_returned_idx'),
+            models.Index(fields=('requested_by', 'req_returned'), name='duel_req_returned_idx'),
+        )
+
     def delete(self, *args, **kwargs):
         # todo: return exchanged scores
         pass
 
+    @serialized_write
     def save(self, *args, **kwargs):
         set_winner = kwargs.pop('set_winner', False)
         set_duel = kwargs.pop('set_duel', False)
         if set_duel:
-            if self.requested_by.current_duels_count() > 0:
+            free = set(Team.objects.free_for_duel().filter(pk__in=(self.requested_by_id, self.to_id))
+                       .values_list('pk', flat=True))
+            if self.requested_by_id not in free:
                 raise ValidationError(f"Team {self.requested_by} is currently on a duel and can't request for another one!")
-            elif self.to.current_duels_count() > 0:
+            elif self.to_id not in free:
                 raise ValidationError(f"Team {self.to} is currently on a duel! if this is a random team selection please try again!")
         if set_winner:
             if not self.pending:
                 raise ValidationError(f"this duel already has a winner {str(self.winner)}")
-            # print(f"winner id ----> {self.winner_id}")
-            # print(f"requested by id ----> {self.requested_by_id}")
-            # print(f"to id: ------> {self.to_id}")
-            # print(type(self.winner_id), type(self.requested_by_id))
-            if self.winner_id == self.requested_by.id:
-                # print("WTF is going on?")
+            if self.winner_id == self.requested_by_id:
                 winner = self.requested_by
                 loser = self.to
             else:
-                # print("this is fucked up! but whyyyyy???")
                 winner = self.to
                 loser = self.requested_by
-            worth = loser.score * self.__class__.TYPES[self.type]['factor']
-            print(worth)
-            # print(f"winner ---> {winner.id}, {winner}")
-            # print(f"loser ---> {loser.id}, {loser}")
-            loser.score -= worth
-            winner.score += worth
-            Transaction.objects.create(decreased_from=loser, increased_to=winner, amount=worth,
-                                       reason=Transaction.DUEL, extra=f'problem -> f{str(self.problem)}')
-            loser.save()
-            winner.save()
-            self.pending = False
-            self.req_returned = True
-            self.to_returned = True
+            with timer('duel'), transaction.atomic():
+                resolved = Duel.objects.filter(pk=self.pk, pending=True).update(
+                    winner_id=self.winner_id, pending=False, req_returned=True, to_returned=True
+                )
+                if not resolved:
+                    raise ValidationError("this duel already has a winner")
+                factor = self.__class__.TYPES[self.type]['factor']
+                Transaction.objects.transfer(loser, winner, lambda score: score * factor, Transaction.DUEL,
+                                             extra=f'problem -> {str(self.problem)}')
+                self.pending = False
+                self.req_returned = True
+                self.to_returned = True
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
+        invalidate_team(self.requested_by_id, self.to_id)
+
+
+class ScoreConflict(Exception):
+    """
+    A team's version changed between reading its score and writing the new one.
+    """
+
+
+def change_scores(teams, compute, then=None, retries=None):
+    """
+    Optimistic read-modify-write of team scores. `teams` are Team instances or
+    ids (the house account is skipped); `compute(scores)` gets their current
+    scores by id and returns the change of each by id. The new scores are
+    written on the condition that every team still has the version they were
+    read at, and `then(changes)` runs in the same transaction, e.g. to record
+    them in the ledger. When a team changed meanwhile, the scores are read again
+    and the round is retried, at most `retries` (settings.SCORE_UPDATE_RETRIES)
+    times. Returns what `then` returns, or the changes.
+
+    The first round starts from the score and version of loaded instances, or
+    reads them before the transaction, so on sqlite the transaction starts with
+    the write that takes the lock and at most one retry is ever needed.
+    """
+    teams = {team if isinstance(team, int) else team.pk: team for team in teams}
+    teams = {pk: team for pk, team in teams.items() if pk >= 0}
+
+    def read():
+        return {pk: (score, version) for pk, score, version
+                in Team.allobjs.filter(pk__in=teams).order_by().values_list('pk', 'score', 'version')}
+
+    known = {
+        pk: (team.__dict__['score'], team.__dict__['version']) for pk, team in teams.items()
+        if isinstance(team, Team) and not team._state.adding and 'score' in team.__dict__ and 'version' in team.__dict__
+    }
+    if len(known) != len(teams):
+        known = read()
+    retries = settings.SCORE_UPDATE_RETRIES if retries is None else retries
+    with transaction.atomic(savepoint=False):
+        for _ in range(retries + 1):
+            changes = {pk: change for pk, change in compute({pk: score for pk, (score, _) in known.items()}).items()
+                       if pk in known and change}
+            try:
+                # a savepoint, so none of the new scores is kept when some team conflicts;
+                # a failed update of a single team changed nothing and goes without it
+                with transaction.atomic() if len(changes) > 1 else nullcontext():
+                    versions = Q()
+                    for pk in changes:
+                        versions |= Q(pk=pk, version=known[pk][1])
+                    if changes and Team.allobjs.filter(versions).update(version=F('version') + 1, score=Case(
+                        *[When(pk=pk, then=Value(known[pk][0] + change)) for pk, change in changes.items()],
+                        output_field=models.FloatField()
+                    )) != len(changes):
+                        raise ScoreConflict
+            except ScoreConflict:
+                # the failed write already holds sqlite's lock, the scores read now stay current until commit
+                known = read()
+                continue
+            result = then(changes) if then is not None else changes
+            break
+        else:
+            raise ValidationError("Team scores kept changing meanwhile, please try again")
+    for pk, change in changes.items():
+        if isinstance(teams[pk], Team):
+            teams[pk]._set_score(known[pk][0] + change, known[pk][1] + 1)
+    return result
+
+
+class TransactionManager(models.Manager):
+
+    @serialized_write
+    def transfer(self, decreased_from, increased_to, amount, reason, extra=None):
+        """
+        Moves `amount` of score between two teams through change_scores() and
+        records it in the ledger, all in one database transaction. `amount` may
+        be a function of the decreased team's current score. The house account
+        (Team.SHEKIB_JIB) has infinite score and is never updated.
+        """
+        moved = None
+
+        def compute(scores):
+            nonlocal moved
+            moved = amount(scores[decreased_from.pk]) if callable(amount) else amount
+            changes = defaultdict(float)
+            changes[decreased_from.pk] -= moved
+            changes[increased_to.pk] += moved
+            return changes
+
+        def record(changes):
+            record = self.create(decreased_from=decreased_from, increased_to=increased_to, amount=moved,
+                                 reason=reason, extra=extra)
+            invalidate_team(decreased_from.pk, increased_to.pk)
+            invalidate_scoreboard()
+            return record
+
+        return change_scores((decreased_from, increased_to), compute, then=record)
+
+    @serialized_write
+    def transfer_many(self, records):
+        """
+        Bulk version of transfer(): applies the unsaved Transaction `records` with
+        a single score update and a single insert.
+        """
+        changes = defaultdict(float)
+        for record in records:
+            if record.decreased_from_id >= 0:
+                changes[record.decreased_from_id] -= record.amount
+            if record.increased_to_id >= 0:
+                changes[record.increased_to_id] += record.amount
+
+        def create(applied):
+            created = self.bulk_create(records)
+            invalidate_team(*changes)
+            invalidate_scoreboard()
+            return created
+
+        return change_scores(changes, lambda scores: changes, then=create)
 
 
 class Transaction(models.Model):
@@ -242,3 +703,109 @@ class Transaction(models.Model):
     reason = models.CharField(max_length=1, choices=TRANSACTION_CHOICES)
 
     extra = models.TextField(null=True)
+
+    # NULL for entries recorded before the time was, they predate every timestamped entry
+    created_at = models.DateTimeField(default=timezone.now, null=True, db_index=True)
+
+    objects = TransactionManager()
+
+    class Meta:
+        # reason alone has only a handful of values, an index on it misleads sqlite's planner
+        indexes = (
+            models.Index(fields=('decreased_from', 'reason'), name='transaction_dec_reason_idx'),
+            models.Index(fields=('increased_to', 'reason'), name='transaction_inc_reason_idx'),
+        )
+
+
+class ScoreboardVersion(models.Model):
+    """
+    Single row counter, bumped on every score mutation (see contest.scoreboard).
+    """
+    version = models.BigIntegerField(default=0)
+
+
+class ScoreCheckpointManager(models.Manager):
+
+    def replay(self, scores, after_id, until_id=None, until_time=None, openings=None):
+        """
+        Applies the ledger entries after transaction `after_id`, up to `until_id`
+        and/or `until_time`, to the `scores` dict of team id -> score, in place.
+        Teams not in `scores` start from `openings` (Team.opening_scores()).
+        Entries without a time are before any `until_time`.
+        """
+        ledger = Transaction.objects.filter(id__gt=after_id).order_by()
+        if until_id is not None:
+            ledger = ledger.filter(id__lte=until_id)
+        if until_time is not None:
+            ledger = ledger.filter(Q(created_at__lte=until_time) | Q(created_at__isnull=True))
+        for field, sign in (('increased_to', 1), ('decreased_from', -1)):
+            for team_id, total in ledger.filter(**{f'{field}__gte': 0}).values_list(field).annotate(total=Sum('amount')):
+                if team_id not in scores:
+                    if openings is None:
+                        openings = Team.opening_scores()
+                    scores[team_id] = openings.get(team_id, Team.INITIAL_SCORE)
+                scores[team_id] += sign * total
+        return scores
+
+    def latest(self, time=None):
+        """
+        (last transaction id, scores by team id) of the newest checkpoint taken
+        at or before `time`, or (0, {}) when there is none. Checkpoints without
+        a time only cover entries without one, they are before any `time`.
+        """
+        checkpoints = self.order_by('-last_transaction_id')
+        if time is not None:
+            checkpoints = checkpoints.filter(Q(time__lte=time) | Q(time__isnull=True))
+        last = checkpoints.values_list('last_transaction_id', flat=True).first()
+        if last is None:
+            return 0, {}
+        return last, dict(self.filter(last_transaction_id=last).values_list('team_id', 'score'))
+
+    def scores_at(self, time):
+        """
+        Every team's score at `time`, replayed from the closest checkpoint before it.
+        """
+        openings = Team.opening_scores()
+        last, scores = self.latest(time)
+        scores = self.replay(scores, last, until_time=time, openings=openings)
+        for team_id, opening in openings.items():
+            scores.setdefault(team_id, opening)
+        return scores
+
+    def take(self, every=1000):
+        """
+        Adds a checkpoint for every `every` ledger entries after the newest
+        checkpoint. Checkpoints are replayed from the ledger, not copied from
+        the teams, so they stay exact while scores keep changing. Returns how
+        many checkpoints were added.
+        """
+        last, scores = self.latest()
+        openings = Team.opening_scores()
+        taken = 0
+        while True:
+            boundary = Transaction.objects.filter(id__gt=last).order_by('id')\
+                .values_list('id', 'created_at')[every - 1:every].first()
+            if boundary is None:
+                return taken
+            until, time = boundary
+            self.replay(scores, last, until_id=until, openings=openings)
+            self.bulk_create([
+                ScoreCheckpoint(team_id=team_id, score=score, last_transaction_id=until, time=time)
+                for team_id, score in scores.items()
+            ])
+            last = until
+            taken += 1
+
+
+class ScoreCheckpoint(models.Model):
+    """
+    A team's score after the ledger entry `last_transaction_id`, taken at
+    `time` (that entry's time, NULL when it has none); point-in-time
+    scoreboards replay the ledger from the newest one.
+    """
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='checkpoints')
+    score = models.FloatField()
+    last_transaction_id = models.IntegerField(db_index=True)
+    time = models.DateTimeField(null=True, db_index=True)
+
+    objects = ScoreCheckpointManager()
@@ -0,0 +1,128 @@
+"""
+Query profiling for development and tests.
+
+With settings.CONTEST_QUERY_PROFILE on, QueryProfileMiddleware logs every
+request's SQL grouped by the line of project code that ran it, and warns
+about statements repeated from one place (usually an N+1). query_budget()
+fails a test when a view or form runs more queries than declared.
+"""
+import logging
+import os
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+logger = logging.getLogger('contest.queries')
+
+
+def call_site():
+    """
+    'path:line in function' of the innermost project code on the stack, or of
+    the innermost framework code outside the database layer when there is none
+    (e.g. a query run while a template renders).
+    """
+    fallback = None
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        filename = frame.filename
+        if filename == __file__ or os.sep + 'django' + os.sep + 'db' + os.sep in filename:
+            continue
+        site = f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}'
+        if filename.startswith(settings.BASE_DIR) and 'site-packages' not in filename:
+            return site
+        fallback = fallback or site
+    return fallback or '<unknown>'
+
+
+class QueryLog:
+    """
+    Database execute wrapper that keeps (call site, sql, params, seconds) of every query.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((call_site(), sql, params, time.perf_counter() - start))
+
+    def __len__(self):
+        return len(self.queries)
+
+    def by_site(self):
+        sites = OrderedDict()
+        for site, sql, params, duration in self.queries:
+            sites.setdefault(site, []).append((sql, params, duration))
+        return sites
+
+    def repeated(self):
+        """
+        (call site, sql, times, distinct parameters) of every statement run more
+        than once from the same place.
+        """
+        runs = OrderedDict()
+        for site, sql, params, _ in self.queries:
+            runs.setdefault((site, sql), []).append(repr(params))
+        return [(site, sql, len(params), len(set(params))) for (site, sql), params in runs.items() if len(params) > 1]
+
+    def report(self):
+        lines = [f'{len(self.queries)} queries in {sum(each[3] for each in self.queries) * 1000:.1f}ms']
+        for site, queries in self.by_site().items():
+            lines.append(f'  {len(queries)} x {site} ({sum(each[2] for each in queries) * 1000:.1f}ms)')
+            lines.extend(f'      {sql}' for sql in OrderedDict.fromkeys(each[0] for each in queries))
+        for site, sql, times, distinct in self.repeated():
+            kind = 'possible N+1' if distinct > 1 else 'duplicate'
+            lines.append(f'  {kind}: {times} x from {site}: {sql}')
+        return '\n'.join(lines)
+
+
+class QueryProfileMiddleware:
+    """
+    Logs the SQL of every request by call site, with a warning when one is repeated.
+    """
+
+    def __init__(self, get_response):
+        if not settings.CONTEST_QUERY_PROFILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        log = QueryLog()
+        with connection.execute_wrapper(log):
+            response = self.get_response(request)
+        level = logging.WARNING if log.repeated() else logging.INFO
+        logger.log(level, '%s %s: %s', request.method, request.path, log.report())
+        return response
+
+
+class query_budget(ContextDecorator):
+    """
+    Fails with the profile of the offending queries when the wrapped block or
+    test runs more than `budget` queries:
+
+        @query_budget(4)
+        def test_scoreboard(self):
+            ...
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+
+    def __enter__(self):
+        self.log = QueryLog()
+        self._wrapper = connection.execute_wrapper(self.log)
+        self._wrapper.__enter__()
+        return self.log
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._wrapper.__exit__(exc_type, exc_value, tb)
+        if exc_type is None and len(self.log) > self.budget:
+            raise AssertionError(f'query budget of {self.budget} exceeded, {self.log.report()}')
+        return False
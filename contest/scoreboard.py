@@ -0,0 +1,384 @@
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Max, Min
+
+SCOREBOARD_CACHE_KEY = 'contest:scoreboard'
+SNAPSHOT_CACHE_KEY = 'contest:scoreboard:snapshot:{}'
+# how long a client may lag behind and still get a delta instead of the full board
+SNAPSHOT_TIMEOUT = 15 * 60
+HISTORY_CACHE_KEY = 'contest:history:{}:{}'
+TEAM_CACHE_KEY = 'contest:team:{}'
+
+
+def current_version():
+    from .models import ScoreboardVersion
+
+    return ScoreboardVersion.objects.filter(id=1).values_list('version', flat=True).first() or 0
+
+
+def bump_version():
+    from .models import ScoreboardVersion
+
+    if not ScoreboardVersion.objects.filter(id=1).update(version=F('version') + 1):
+        ScoreboardVersion.objects.get_or_create(id=1, defaults={'version': 1})
+
+
+def build_scoreboard():
+    from .models import Team
+    from .serializers import TeamSerializers
+
+    version = current_version()
+    queryset = Team.objects.ranked().prefetch_related('problems')
+    teams = [dict(each) for each in TeamSerializers(queryset, many=True).data]
+    cache.set(SNAPSHOT_CACHE_KEY.format(version),
+              {each['id']: (each['score'], each['rank']) for each in teams},
+              SNAPSHOT_TIMEOUT)
+    return {'version': version, 'teams': teams}
+
+
+def cached_scoreboard():
+    """
+    The cached scoreboard, or None when there is none or it is not of the
+    committed version. The version is read from the database, so a board cached
+    in this process is dropped after a change made by any other process, and
+    so is a pre-commit board a reader cached after the change dropped it.
+    """
+    board = cache.get(SCOREBOARD_CACHE_KEY)
+    if board is None or board['version'] != current_version():
+        return None
+    return board
+
+
+def get_scoreboard():
+    """
+    Ranked scoreboard payload and its version, served from the cache until a score changes
+    (one query for the version).
+    """
+    board = cached_scoreboard()
+    if board is None:
+        board = build_scoreboard()
+        cache.set(SCOREBOARD_CACHE_KEY, board, None)
+    return board
+
+
+def get_scoreboard_page(limit=None, offset=0, after=None):
+    """
+    A slice of the cached ranked scoreboard: `limit` teams starting at `offset`,
+    or right after the team with id `after` (keyset pagination).
+    """
+    board = get_scoreboard()
+    teams = board['teams']
+    if after is not None:
+        offset = next((ind + 1 for ind, each in enumerate(teams) if each['id'] == after), len(teams))
+    end = len(teams) if limit is None else offset + limit
+    page = teams[offset:end]
+    return {
+        'version': board['version'],
+        'count': len(teams),
+        'next': page[-1]['id'] if page and end < len(teams) else None,
+        'teams': page,
+    }
+
+
+def get_team_rank(pk, neighbours=2):
+    """
+    The team `pk` with its rank and its `neighbours` above and below, without
+    loading the whole scoreboard. Raises Team.DoesNotExist for unknown teams.
+    """
+    from django.db.models import Q, prefetch_related_objects
+    from .models import Team
+    from .serializers import TeamSerializers
+
+    team = Team.objects.with_rank().get(pk=pk)
+    ranked = Team.objects.with_rank()
+    above = list(ranked.filter(Q(score__gt=team.score) | Q(score=team.score, id__lt=team.id))
+                 .order_by('score', '-id')[:neighbours])[::-1]
+    below = list(ranked.filter(Q(score__lt=team.score) | Q(score=team.score, id__gt=team.id))
+                 .order_by('-score', 'id')[:neighbours])
+    prefetch_related_objects([team] + above + below, 'problems')
+    return {
+        'team': TeamSerializers(team).data,
+        'above': TeamSerializers(above, many=True).data,
+        'below': TeamSerializers(below, many=True).data,
+    }
+
+
+def build_team_details(pk):
+    """
+    A team with its attempt, ledger and duel statistics, one conditional
+    aggregate query per table. Raises Team.DoesNotExist for unknown teams.
+    """
+    from django.db.models import Avg, Count, DurationField, ExpressionWrapper, Q, Sum
+    from .models import Duel, Team, Transaction
+
+    solved = Q(solvingattempt__state='SD')
+    team = Team.objects.annotate(
+        solved_count=Count('solvingattempt', filter=solved),
+        active_problems=Count('solvingattempt', filter=Q(solvingattempt__state='S')),
+        average_solve_duration=Avg(ExpressionWrapper(F('solvingattempt__end_time') - F('solvingattempt__start_time'),
+                                                     output_field=DurationField()),
+                                   filter=solved & Q(solvingattempt__end_time__isnull=False)),
+    ).values('id', 'name', 'score', 'solved_count', 'active_problems', 'average_solve_duration').get(pk=pk)
+    team.update(Transaction.objects.filter(Q(decreased_from=pk) | Q(increased_to=pk)).aggregate(
+        total_spent=Sum('amount', filter=Q(decreased_from=pk, reason=Transaction.PROBLEM_REQ)),
+        total_earned=Sum('amount', filter=Q(increased_to=pk, reason=Transaction.PROBLEM_SLV)),
+    ))
+    team.update(Duel.objects.filter(Q(requested_by=pk) | Q(to=pk)).aggregate(
+        pending_duels=Count('id', filter=Q(pending=True)),
+        duels_won=Count('id', filter=Q(pending=False, winner=pk)),
+        duels_lost=Count('id', filter=Q(pending=False) & ~Q(winner=pk)),
+    ))
+    team['total_spent'] = team['total_spent'] or 0
+    team['total_earned'] = team['total_earned'] or 0
+    duration = team['average_solve_duration']
+    team['average_solve_duration'] = duration.total_seconds() if duration is not None else None
+    return team
+
+
+def get_team_details(pk):
+    """
+    Cached build_team_details(), until something of that team changes (see invalidate_team()).
+    """
+    key = TEAM_CACHE_KEY.format(pk)
+    details = cache.get(key)
+    if details is None:
+        details = build_team_details(pk)
+        cache.set(key, details, None)
+    return details
+
+
+def _drop_cached_teams(team_ids):
+    cache.delete_many([TEAM_CACHE_KEY.format(pk) for pk in team_ids])
+
+
+def invalidate_team(*team_ids):
+    """
+    Drops the cached details of `team_ids`, now and again once the change is committed.
+    """
+    team_ids = [pk for pk in team_ids if pk is not None and pk >= 0]
+    if team_ids:
+        _drop_cached_teams(team_ids)
+        transaction.on_commit(lambda: _drop_cached_teams(team_ids))
+
+
+def get_scoreboard_delta(since):
+    """
+    Teams whose score or rank changed after version `since`. Falls back to the
+    full board (`full` is set) when the snapshot of `since` is no longer known.
+    """
+    board = get_scoreboard()
+    delta = {'version': board['version'], 'full': False, 'teams': [], 'removed': []}
+    if since == board['version']:
+        return delta
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY.format(since)) if since < board['version'] else None
+    if snapshot is None:
+        delta['full'] = True
+        delta['teams'] = board['teams']
+        return delta
+    delta['teams'] = [each for each in board['teams'] if snapshot.get(each['id']) != (each['score'], each['rank'])]
+    delta['removed'] = sorted(set(snapshot) - {each['id'] for each in board['teams']})
+    return delta
+
+
+def get_scoreboard_at(time):
+    """
+    The ranked scoreboard as it was at `time`, rebuilt from the ledger.
+    """
+    from .models import ScoreCheckpoint, Team
+
+    scores = ScoreCheckpoint.objects.scores_at(time)
+    names = dict(Team.objects.filter(pk__in=scores).values_list('pk', 'name'))
+    teams = sorted(({'id': pk, 'name': names[pk], 'score': score} for pk, score in scores.items() if pk in names),
+                   key=lambda each: (-each['score'], each['id']))
+    for ind, each in enumerate(teams):
+        tied = ind and teams[ind - 1]['score'] == each['score']
+        each['rank'] = teams[ind - 1]['rank'] if tied else ind + 1
+    return {'time': time, 'teams': teams}
+
+
+def build_score_history(points):
+    """
+    Every team's score at `points` evenly spaced moments from the first to the
+    last timestamped ledger entry, in a single pass over the ledger. Entries
+    without a time are counted before the first moment.
+    """
+    from .models import Team, Transaction
+
+    teams = Team.objects.order_by('id').values_list('id', 'name', 'opening_score')
+    names = {pk: name for pk, name, _ in teams}
+    scores = {pk: opening for pk, _, opening in teams}
+    series = {pk: [] for pk in names}
+    bounds = Transaction.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+    if bounds['first'] is None:
+        times = []
+    else:
+        step = (bounds['last'] - bounds['first']) / max(points - 1, 1)
+        times = [bounds['first'] + step * ind for ind in range(points - 1)] + [bounds['last']]
+
+    def sample(until):
+        while len(series_times) < len(times) and (until is None or times[len(series_times)] < until):
+            series_times.append(times[len(series_times)])
+            for pk, score in scores.items():
+                series[pk].append(score)
+
+    series_times = []
+    ledger = Transaction.objects.order_by(F('created_at').asc(nulls_first=True), 'id')\
+        .values_list('decreased_from_id', 'increased_to_id', 'amount', 'created_at')
+    for decreased_from, increased_to, amount, created_at in ledger.iterator(chunk_size=5000):
+        if created_at is not None:
+            sample(created_at)
+        if decreased_from in scores:
+            scores[decreased_from] -= amount
+        if increased_to in scores:
+            scores[increased_to] += amount
+    sample(None)
+    return {
+        'times': series_times,
+        'teams': [{'id': pk, 'name': name, 'scores': series[pk]} for pk, name in names.items()],
+    }
+
+
+def get_score_history(points=100):
+    """
+    Cached build_score_history(), rebuilt once the scoreboard version changes.
+    """
+    version = current_version()
+    key = HISTORY_CACHE_KEY.format(version, points)
+    history = cache.get(key)
+    if history is None:
+        history = dict(build_score_history(points), version=version)
+        cache.set(key, history, SNAPSHOT_TIMEOUT)
+    return history
+
+
+def _drop_cached_scoreboard():
+    cache.delete(SCOREBOARD_CACHE_KEY)
+    broadcaster.notify()
+
+
+def invalidate_scoreboard():
+    bump_version()
+    cache.delete(SCOREBOARD_CACHE_KEY)
+    # a reader may cache the pre-commit board in between, drop it again once the change is visible
+    transaction.on_commit(_drop_cached_scoreboard)
+
+
+class ScoreboardBroadcaster:
+    """
+    Fans scoreboard changes out to every connected event stream.
+
+    A single watcher thread per process looks at the scoreboard version and
+    builds the board once per change; subscribers only wait on a condition
+    and share the encoded event, so viewers never touch the database.
+    """
+
+    def __init__(self, poll_interval=1.0, heartbeat=15.0):
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.condition = threading.Condition()
+        self.wakeup = threading.Event()
+        self.version = None
+        self.message = None
+        self.subscribers = 0
+        self.listeners = []
+        self._watcher = None
+        self._stopped = False
+
+    def notify(self):
+        self.wakeup.set()
+
+    def start(self):
+        with self.condition:
+            if self._watcher is None:
+                self._stopped = False
+                self._watcher = threading.Thread(target=self._watch, name='scoreboard-watcher', daemon=True)
+                self._watcher.start()
+
+    def stop(self):
+        with self.condition:
+            watcher, self._watcher = self._watcher, None
+            self._stopped = True
+            self.version = self.message = None
+            self.condition.notify_all()
+        self.wakeup.set()
+        if watcher is not None:
+            watcher.join()
+
+    def _watch(self):
+        from django.db import connection
+
+        try:
+            while not self._stopped:
+                self.wakeup.clear()
+                if self.subscribers:
+                    self._publish_if_changed()
+                    self.wakeup.wait(self.poll_interval)
+                else:
+                    self.wakeup.wait()
+        finally:
+            connection.close()
+
+    def _publish_if_changed(self):
+        version = current_version()
+        if version == self.version:
+            return
+        board = get_scoreboard()
+        if board['version'] < version:
+            # cached by a process that has not seen this change yet
+            cache.delete(SCOREBOARD_CACHE_KEY)
+            board = get_scoreboard()
+        message = (f"id: {board['version']}\nevent: scoreboard\n"
+                   f"data: {json.dumps(board['teams'], cls=DjangoJSONEncoder, separators=(',', ':'))}\n\n").encode()
+        with self.condition:
+            self.version, self.message = board['version'], message
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+
+    def add_subscriber(self):
+        """
+        Counts a viewer that reads `version` and `message` on its own, e.g. from an
+        event loop woken by a listener; the board is only watched while there is one.
+        """
+        self.start()
+        with self.condition:
+            self.subscribers += 1
+        self.notify()
+
+    def remove_subscriber(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def subscribe(self, last_version=None):
+        """
+        Yields an encoded server-sent event for every scoreboard version after
+        `last_version`, and keep-alive comments in between.
+        """
+        self.add_subscriber()
+        try:
+            yield f"retry: {int(self.poll_interval * 1000)}\n\n".encode()
+            while not self._stopped:
+                with self.condition:
+                    self.condition.wait_for(
+                        lambda: self._stopped or (self.message is not None and self.version != last_version),
+                        timeout=self.heartbeat
+                    )
+                    version, message = self.version, self.message
+                if message is None or version == last_version:
+                    yield b': keep-alive\n\n'
+                    continue
+                last_version = version
+                yield message
+        finally:
+            self.remove_subscriber()
+
+
+broadcaster = ScoreboardBroadcaster(
+    poll_interval=getattr(settings, 'SCOREBOARD_STREAM_POLL_INTERVAL', 1.0),
+    heartbeat=getattr(settings, 'SCOREBOARD_STREAM_HEARTBEAT', 15.0),
+)
@@ -30,10 +30,11 @@ class ProblemSerializer(serializers.ModelSerializer):
 
 class TeamSerializers(serializers.ModelSerializer):
     pending_duels = serializers.IntegerField(read_only='True')
+    rank = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Team
-        fields = '__all__'
+        exclude = ('version', )
 
 
 class DuelSerializer(serializers.ModelSerializer):
@@ -51,3 +52,59 @@ class DuelSerializer(serializers.ModelSerializer):
         d = Duel(**validated_data)
         d.save()
         return d
+
+
+class SolvingAttemptListSerializer(serializers.ModelSerializer):
+    """
+    Flat attempt with the ids and names of its team and problem, for lists;
+    the queryset is expected to select_related('team', 'problem').
+    """
+    team_name = serializers.CharField(source='team.name', read_only=True)
+    problem_level = serializers.CharField(source='problem.level', read_only=True)
+
+    class Meta:
+        model = SolvingAttempt
+        fields = ('id', 'team', 'team_name', 'problem', 'problem_level', 'start_time', 'end_time', 'cost', 'grade',
+                  'state')
+        read_only_fields = fields
+
+
+class DuelListSerializer(serializers.ModelSerializer):
+    """
+    Flat duel with the ids and names of its teams, for lists; the queryset is
+    expected to select_related('requested_by', 'to', 'winner').
+    """
+    requested_by_name = serializers.CharField(source='requested_by.name', read_only=True)
+    to_name = serializers.CharField(source='to.name', read_only=True)
+    winner_name = serializers.CharField(source='winner.name', read_only=True, default=None)
+
+    class Meta:
+        model = Duel
+        fields = ('id', 'requested_by', 'requested_by_name', 'req_returned', 'to', 'to_name', 'to_returned',
+                  'problem', 'winner', 'winner_name', 'type', 'pending')
+        read_only_fields = fields
+
+
+class ProblemStatisticsSerializer(serializers.ModelSerializer):
+    """
+    A problem's attempt counts and averages, durations in seconds; the
+    queryset is expected to select_related('problem').
+    """
+    level = serializers.CharField(source='problem.level', read_only=True)
+    type = serializers.CharField(source='problem.type', read_only=True)
+    solve_rate = serializers.FloatField(read_only=True)
+    average_grade = serializers.FloatField(read_only=True)
+    average_cost = serializers.FloatField(read_only=True)
+    average_duration = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ProblemStatistics
+        fields = ('problem', 'level', 'type', 'attempts', 'solving', 'checking', 'solved', 'solve_rate',
+                  'average_grade', 'average_cost', 'average_duration')
+        read_only_fields = fields
+
+
+class GradeSerializer(serializers.Serializer):
+    team = serializers.IntegerField()
+    problem = serializers.IntegerField()
+    grade = serializers.IntegerField(min_value=0, max_value=100)
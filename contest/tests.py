@@ -1,3 +1,1168 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import F, Q, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import metrics, scoreboard
+from .asgi import ContestASGIApplication
+from .forms import ChangeScore, RequestForDuelForm, RequestProblemForm, SetGradeForm
+from .idempotency import PENDING, RecentTokens
+from .profiling import query_budget
+from .writer import WriteQueue, write_queue
+from .models import change_scores, Problem, ProblemStatistics, Team, SolvingAttempt, Duel, Transaction, ScoreCheckpoint
+
+
+class ScoreboardCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.problem = Problem.objects.create(id=1, level='E', type='P')
+        self.duel_problem = Problem.objects.create(id=2, level='E', type='D')
+        self.team_a = Team.objects.create(name='a', score=500)
+        self.team_b = Team.objects.create(name='b', score=400)
+
+    def scoreboard(self):
+        response = self.client.get('/api/scoreboard/')
+        self.assertEqual(response.status_code, 200)
+        return {each['name']: each for each in response.json()}
+
+    def test_reads_are_served_from_cache(self):
+        self.scoreboard()
+        # only the version is read, to notice changes made by other processes
+        with self.assertNumQueries(1):
+            board = self.scoreboard()
+        self.assertEqual(board['a']['rank'], 1)
+        self.assertEqual(board['b']['rank'], 2)
+        self.assertNotIn('version', board['a'])
+
+    def test_problem_purchase_invalidates(self):
+        self.scoreboard()
+        SolvingAttempt(team=self.team_a, problem=self.problem, cost=150,
+                       start_time=timezone.now()).save(buy_problem=True)
+        board = self.scoreboard()
+        self.assertEqual(board['a']['score'], 350)
+        self.assertEqual(board['a']['problems'], [self.problem.id])
+        self.assertEqual(board['b']['rank'], 1)
+
+    def test_duel_winner_invalidates(self):
+        self.scoreboard()
+        duel = Duel.objects.create(requested_by=self.team_a, to=self.team_b, problem=self.duel_problem, type='1')
+        duel.winner_id = self.team_b.id
+        duel.save(set_winner=True)
+        board = self.scoreboard()
+        self.assertEqual(board['a']['score'], 460)
+        self.assertEqual(board['b']['score'], 440)
+
+    def test_change_score_invalidates(self):
+        self.scoreboard()
+        form = ChangeScore({'change_score': 200, 'reason': 'MF'}, team_id=self.team_b.id)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        board = self.scoreboard()
+        self.assertEqual(board['b']['score'], 600)
+        self.assertEqual(board['b']['rank'], 1)
+
+
+class ScoreboardDeltaTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.duel_problem = Problem.objects.create(id=1, level='E', type='D')
+        self.teams = [Team.objects.create(name=str(i), score=1000 - i * 100) for i in range(5)]
+
+    def delta(self, since):
+        response = self.client.get('/api/scoreboard/', {'since': since})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_version_header_and_no_change(self):
+        response = self.client.get('/api/scoreboard/')
+        version = int(response['X-Scoreboard-Version'])
+        delta = self.delta(version)
+        self.assertEqual(delta['version'], version)
+        self.assertEqual(delta['teams'], [])
+        self.assertFalse(delta['full'])
+
+    def test_only_moved_teams_are_returned(self):
+        version = int(self.client.get('/api/scoreboard/')['X-Scoreboard-Version'])
+        duel = Duel.objects.create(requested_by=self.teams[3], to=self.teams[4], problem=self.duel_problem, type='1')
+        duel.winner_id = self.teams[4].id
+        duel.save(set_winner=True)
+        delta = self.delta(version)
+        self.assertGreater(delta['version'], version)
+        self.assertFalse(delta['full'])
+        self.assertEqual({each['id'] for each in delta['teams']}, {self.teams[3].id, self.teams[4].id})
+        self.assertEqual([each['rank'] for each in delta['teams']], [4, 5])
+
+    def test_unknown_version_returns_full_board(self):
+        delta = self.delta(10 ** 6)
+        self.assertTrue(delta['full'])
+        self.assertEqual(len(delta['teams']), 5)
+
+    def test_removed_team(self):
+        version = int(self.client.get('/api/scoreboard/')['X-Scoreboard-Version'])
+        removed_id = self.teams[2].id
+        self.teams[2].delete()
+        delta = self.delta(version)
+        self.assertEqual(delta['removed'], [removed_id])
+        self.assertEqual([each['rank'] for each in delta['teams']], [3, 4])
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get('/api/scoreboard/', {'since': 'x'}).status_code, 400)
+
+
+class ScoreboardCacheRaceTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = Team.objects.create(name='a', score=500)
+
+    def test_board_cached_after_the_commit_is_stale(self):
+        stale = scoreboard.get_scoreboard()
+        Transaction.objects.transfer(Team.SHEKIB_JIB, self.team, 10, Transaction.MAFIA)
+        # a reader that built the board before the commit caches it after the drop on commit
+        cache.set(scoreboard.SCOREBOARD_CACHE_KEY, stale, None)
+        self.assertIsNone(scoreboard.cached_scoreboard())
+        board = self.client.get('/api/scoreboard/')
+        self.assertGreater(int(board['X-Scoreboard-Version']), stale['version'])
+        self.assertEqual(board.json()[0]['score'], 510)
+
+    def test_board_changed_by_another_process_is_stale(self):
+        stale = scoreboard.get_scoreboard()
+        Transaction.objects.transfer(Team.SHEKIB_JIB, self.team, 10, Transaction.MAFIA)
+        # another worker only drops the board from its own cache, this one still holds the old board
+        cache.set(scoreboard.SCOREBOARD_CACHE_KEY, stale, None)
+        self.assertEqual(self.client.get('/api/scoreboard/').json()[0]['score'], 510)
+
+
+class ScoreboardStreamTest(TransactionTestCase):
+    SUBSCRIBERS = 100
+
+    def setUp(self):
+        cache.clear()
+        self.teams = [Team.objects.create(name=str(i), score=500 - i) for i in range(3)]
+        self.broadcaster = scoreboard.ScoreboardBroadcaster(poll_interval=0.05, heartbeat=0.1)
+
+    def tearDown(self):
+        self.broadcaster.stop()
+        scoreboard.broadcaster.stop()
+
+    def test_one_build_per_change_for_all_subscribers(self):
+        received = [[] for _ in range(self.SUBSCRIBERS)]
+        first_event = threading.Barrier(self.SUBSCRIBERS + 1, timeout=10)
+
+        def subscriber(events):
+            stream = self.broadcaster.subscribe()
+            for chunk in stream:
+                if chunk.startswith(b'id: '):
+                    events.append(chunk)
+                    if len(events) == 1:
+                        first_event.wait()
+                    else:
+                        break
+            stream.close()
+
+        with mock.patch.object(scoreboard, 'build_scoreboard', wraps=scoreboard.build_scoreboard) as build:
+            threads = [threading.Thread(target=subscriber, args=(events, )) for events in received]
+            for thread in threads:
+                thread.start()
+            first_event.wait()
+            team = Team.objects.get(id=self.teams[2].id)
+            team.score = 1000
+            team.save()
+            for thread in threads:
+                thread.join(10)
+            self.assertEqual(build.call_count, 2)
+
+        self.assertTrue(all(len(events) == 2 for events in received))
+        self.assertEqual(len({events[1] for events in received}), 1)
+        board = json.loads(received[0][1].split(b'data: ', 1)[1])
+        self.assertEqual((board[0]['id'], board[0]['rank']), (team.id, 1))
+        self.assertEqual(self.broadcaster.subscribers, 0)
+
+    def test_stream_view(self):
+        response = self.client.get('/api/scoreboard/stream/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertTrue(next(stream).startswith(b'retry: '))
+        self.assertTrue(next(stream).startswith(b'id: '))
+        response.close()
+
+
+class TeamAdminChangelistTest(TestCase):
+    CHANGELIST_QUERIES = 5
+
+    def setUp(self):
+        self.problem = Problem.objects.create(id=1, level='E', type='P')
+        self.duel_problem = Problem.objects.create(id=2, level='E', type='D')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def add_teams(self, count):
+        now = timezone.now()
+        for i in range(count):
+            team = Team.objects.create(name=f'team-{i}')
+            SolvingAttempt.objects.create(team=team, problem=self.problem, cost=100, start_time=now, state='SD')
+            Duel.objects.create(requested_by=team, to=team, problem=self.duel_problem, type='1', to_returned=True)
+
+    def changelist(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/admin/contest/team/')
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_constant_number_of_queries(self):
+        self.add_teams(3)
+        _, few = self.changelist()
+        self.add_teams(30)
+        response, many = self.changelist()
+        self.assertEqual(few, many)
+        self.assertEqual(many, self.CHANGELIST_QUERIES)
+        self.assertContains(response, '/admin/contest/team/%d/request-duel/' % Team.objects.order_by('pk').last().pk)
+
+    def test_annotations_match_model_methods(self):
+        self.add_teams(2)
+        for team in Team.objects.with_stats():
+            self.assertEqual(team.current_duels, team.current_duels_count())
+            self.assertEqual(team.current_duels, 1)
+            self.assertEqual(team.solved_count, team.solved_problems)
+            self.assertEqual(team.solved_count, 1)
+
+
+class ConcurrentScoreMutationTest(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 15
+
+    def setUp(self):
+        cache.clear()
+        self.teams = [Team.objects.create(name=str(i), score=10000) for i in range(4)]
+        Problem.objects.bulk_create(Problem(id=i, level='E', type='P') for i in range(self.THREADS * self.ROUNDS))
+        Problem.objects.create(id=-1, level='E', type='D')
+
+    def worker(self, index, errors):
+        try:
+            for j in range(self.ROUNDS):
+                team = self.teams[(index + j) % len(self.teams)]
+                form = ChangeScore({'change_score': 7, 'reason': 'MF'}, team_id=team.id)
+                form.is_valid()
+                form.save()
+                # the judges' path: the attempt only carries team_id
+                form = RequestProblemForm({'problem': str(index * self.ROUNDS + j), 'cost': 100}, team_id=team.id)
+                self.assertTrue(form.is_valid(), form.errors)
+                try:
+                    attempt = form.save()
+                except ValidationError:
+                    continue
+                attempt.grade = 75
+                attempt.save(cal_reward=True)
+                if j % 5 == 0:
+                    duel = Duel.objects.create(requested_by_id=team.id, to_id=self.teams[index % 2].id,
+                                               problem_id=-1, type='1')
+                    duel.winner_id = team.id
+                    duel.save(set_winner=True)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def test_scores_match_ledger(self):
+        errors = []
+        threads = [threading.Thread(target=self.worker, args=(i, errors)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(Transaction.objects.filter(reason='MF').count(), self.THREADS * self.ROUNDS)
+        for team in Team.objects.all():
+            increased = team.increases.aggregate(total=Sum('amount'))['total'] or 0
+            decreased = team.decreases.aggregate(total=Sum('amount'))['total'] or 0
+            self.assertAlmostEqual(team.score, 10000 + increased - decreased, places=6)
+            self.assertEqual(team.solvingattempt_set.filter(state='S').count(), 0)
+
+
+class OptimisticScoreTest(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 25
+
+    def setUp(self):
+        cache.clear()
+        self.team = Team.objects.create(name='team', score=1000)
+
+    def test_stale_save_keeps_concurrent_changes(self):
+        stale = Team.objects.get(pk=self.team.pk)
+        Transaction.objects.transfer(Team.SHEKIB_JIB, Team.objects.get(pk=self.team.pk), 10, Transaction.MAFIA)
+        stale.name = 'renamed'
+        stale.score += 5
+        stale.save()
+        team = Team.objects.get(pk=self.team.pk)
+        self.assertEqual((team.name, team.score, team.version), ('renamed', 1015, 2))
+        self.assertEqual((stale.score, stale.version), (1015, 2))
+
+    def test_created_instance_does_not_overwrite_later_changes(self):
+        Transaction.objects.transfer(Team.SHEKIB_JIB, Team.objects.get(pk=self.team.pk), 50, Transaction.MAFIA)
+        self.team.name = 'renamed'
+        self.team.save()
+        team = Team.objects.get(pk=self.team.pk)
+        self.assertEqual((team.name, team.score, team.version), ('renamed', 1050, 1))
+        self.team.save(update_fields=[])
+        self.team.name = 'not saved'
+        self.team.save(update_fields=[])
+        self.assertEqual(Team.objects.get(pk=self.team.pk).name, 'renamed')
+        partial = Team.objects.only('id', 'name').get(pk=self.team.pk)
+        partial.name = 'partial'
+        partial.save()
+        self.assertEqual(Team.objects.values_list('name', 'score').get(pk=self.team.pk), ('partial', 1050))
+
+    def test_admin_change_form_keeps_concurrent_changes(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        url = f'/admin/contest/team/{self.team.pk}/change/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        Transaction.objects.transfer(Team.SHEKIB_JIB, Team.objects.get(pk=self.team.pk), 100, Transaction.MAFIA)
+        response = self.client.post(url, {'name': 'renamed', 'score': 1000})
+        self.assertEqual(response.status_code, 302)
+        team = Team.objects.get(pk=self.team.pk)
+        self.assertEqual((team.name, team.score), ('renamed', 1100))
+
+    def test_conflict_is_retried(self):
+        stale = Team.objects.get(pk=self.team.pk)
+        Transaction.objects.transfer(Team.SHEKIB_JIB, Team.objects.get(pk=self.team.pk), 10, Transaction.MAFIA)
+        with CaptureQueriesContext(connection) as queries:
+            Transaction.objects.transfer(stale, Team.SHEKIB_JIB, 30, Transaction.MAFIA)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "contest_team"')]
+        # the first try starts from the stale instance, the second from the reloaded row
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score, 980)
+        stale = Team.objects.get(pk=self.team.pk)
+        Transaction.objects.transfer(Team.SHEKIB_JIB, Team.objects.get(pk=self.team.pk), 10, Transaction.MAFIA)
+        with self.assertRaises(ValidationError):
+            change_scores((stale, ), lambda scores: {stale.pk: 1}, retries=0)
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score, 990)
+
+    def test_no_lost_updates_on_a_hot_team(self):
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(self.ROUNDS):
+                    # loaded up front, so concurrent changes make most first tries conflict
+                    form = ChangeScore({'change_score': 3, 'reason': 'MF'}, team_id=self.team.id)
+                    form.is_valid()
+                    form.save()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        team = Team.objects.get(pk=self.team.pk)
+        self.assertEqual(team.score, 1000 + 3 * self.THREADS * self.ROUNDS)
+        self.assertEqual(team.version, self.THREADS * self.ROUNDS)
+        self.assertEqual(team.increases.count(), self.THREADS * self.ROUNDS)
+
+
+@override_settings(CONTEST_WRITE_QUEUE=True)
+class QueuedScoreMutationTest(ConcurrentScoreMutationTest):
+    """
+    The same concurrent judges, with every mutation applied by the single writer.
+    """
+
+    def tearDown(self):
+        write_queue.stop()
+
+    def test_mutations_run_on_the_writer(self):
+        team = self.teams[0]
+        record = Transaction.objects.transfer(Team.SHEKIB_JIB, team, 5, Transaction.MAFIA)
+        self.assertIsNotNone(record.pk)
+        self.assertIsNotNone(write_queue._worker)
+        with self.assertRaises(ValidationError):
+            SolvingAttempt(team=team, problem_id=1, cost=10, start_time=timezone.now()).save(buy_problem=True)
+        self.assertEqual(Team.objects.get(pk=team.pk).score, 10005)
+
+
+class WriteQueueTest(TransactionTestCase):
+
+    def setUp(self):
+        self.queue = WriteQueue(batch_size=10)
+        self.team = Team.objects.create(name='team', score=0)
+
+    def tearDown(self):
+        self.queue.stop()
+
+    def add(self, amount):
+        Team.allobjs.filter(pk=self.team.pk).update(score=F('score') + amount)
+        if amount < 0:
+            raise ValidationError('negative')
+        return amount
+
+    def test_failure_only_rolls_back_itself(self):
+        release = threading.Event()
+        first = self.queue.submit(release.wait)
+        # queued while the worker is busy, so they are applied as one batch
+        futures = [self.queue.submit(self.add, amount) for amount in (1, -2, 4)]
+        release.set()
+        self.assertTrue(first.result())
+        self.assertEqual(futures[0].result(), 1)
+        with self.assertRaises(ValidationError):
+            futures[1].result()
+        self.assertEqual(futures[2].result(), 4)
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score, 5)
+
+
+class SqlitePragmasTest(TransactionTestCase):
+
+    def tearDown(self):
+        connection.close()
+
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1234, 'synchronous': 'NORMAL', 'busy_timeout': 4321})
+    def test_applied_to_new_connections(self):
+        connection.close()
+        with connection.cursor() as cursor:
+            values = []
+            for name in ('cache_size', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {name}')
+                values.append(cursor.fetchone()[0])
+        # synchronous NORMAL reads back as 1
+        self.assertEqual(values, [-1234, 1, 4321])
+
+
+class ShekibJibTest(TestCase):
+
+    def setUp(self):
+        Team.reset_shekib_jib()
+
+    def test_house_account_is_memoized(self):
+        team = Team.objects.create(name='a')
+        house = Team.SHEKIB_JIB
+        self.assertEqual(house.id, Team.SHEKIB_JIB_ID)
+        with self.assertNumQueries(0):
+            self.assertIs(Team.SHEKIB_JIB, house)
+        form = ChangeScore({'change_score': 10, 'reason': 'MF'}, team_id=team.id)
+        self.assertTrue(form.is_valid(), form.errors)
+        # the versioned score update, the ledger entry and the scoreboard version
+        with self.assertNumQueries(3):
+            form.save()
+        self.assertEqual(Transaction.objects.get().decreased_from_id, Team.SHEKIB_JIB_ID)
+
+    def test_created_by_migrate(self):
+        self.assertTrue(Team.allobjs.filter(id=Team.SHEKIB_JIB_ID).exists())
+        self.assertFalse(Team.objects.filter(id=Team.SHEKIB_JIB_ID).exists())
+
+
+class RequestForDuelFormTest(TestCase):
+
+    def setUp(self):
+        self.problem = Problem.objects.create(id=1, level='E', type='D')
+        self.team = Team.objects.create(name='requester')
+
+    def add_teams(self, count):
+        teams = [Team.objects.create(name=f'team-{i}') for i in range(count)]
+        Duel.objects.create(requested_by=teams[0], to=teams[1], problem=self.problem, type='1')
+        return teams
+
+    def test_random_opponent_is_free(self):
+        teams = self.add_teams(4)
+        form = RequestForDuelForm({'type': '1'}, team_id=str(self.team.id))
+        self.assertEqual({choice for choice, _ in form.fields['to_team'].choices},
+                         {None, teams[2].id, teams[3].id})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIn(form.cleaned_data['to_team'], teams[2:])
+        duel = form.save()
+        self.assertEqual(duel.problem, self.problem)
+        self.assertEqual(self.team.current_duels_count(), 1)
+
+    def test_no_free_team(self):
+        self.add_teams(2)
+        form = RequestForDuelForm({'type': '1'}, team_id=self.team.id)
+        self.assertFalse(form.is_valid())
+        self.assertIn('to_team', form.errors)
+
+    def test_constant_number_of_queries(self):
+        counts = []
+        for count in (3, 30):
+            self.add_teams(count)
+            with CaptureQueriesContext(connection) as queries:
+                form = RequestForDuelForm({'type': '2'}, team_id=self.team.id)
+                self.assertTrue(form.is_valid(), form.errors)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class BulkGradeTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Problem.objects.bulk_create(Problem(id=i, level='M', type='P') for i in range(1, 4))
+        self.teams = [Team.objects.create(name=str(i), score=500) for i in range(3)]
+        now = timezone.now()
+        for team in self.teams:
+            for problem_id in (1, 2):
+                SolvingAttempt.objects.create(team=team, problem_id=problem_id, cost=100, start_time=now, state='C')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def grade(self, entries):
+        return self.client.post('/api/attempts/grade/', entries, content_type='application/json')
+
+    def test_api_grades_in_bulk(self):
+        self.client.force_login(self.admin)
+        entries = [{'team': team.id, 'problem': problem_id, 'grade': 100}
+                   for team in self.teams for problem_id in (1, 2)]
+        # plus reading the team versions and one problem statistics update per problem
+        with self.assertNumQueries(15):
+            response = self.grade(entries)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([each['reward'] for each in response.json()], [175.0] * 6)
+        for team in Team.objects.all():
+            self.assertEqual(team.score, 850)
+        self.assertEqual(Transaction.objects.filter(reason=Transaction.PROBLEM_SLV).count(), 6)
+        self.assertFalse(SolvingAttempt.objects.exclude(state='SD').exists())
+        self.assertEqual(self.client.get('/api/scoreboard/').json()[0]['score'], 850)
+
+    def test_already_graded_changes_nothing(self):
+        self.client.force_login(self.admin)
+        SolvingAttempt.objects.filter(team=self.teams[1], problem_id=2).update(state='SD')
+        response = self.grade([{'team': team.id, 'problem': 2, 'grade': 50} for team in self.teams])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(SolvingAttempt.objects.filter(state='SD').count(), 1)
+
+    def test_requires_staff(self):
+        response = self.grade([{'team': self.teams[0].id, 'problem': 1, 'grade': 50}])
+        self.assertEqual(response.status_code, 403)
+
+    def test_admin_bulk_grade(self):
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/contest/team/', {
+            'action': 'grade_attempts', '_selected_action': [self.teams[0].id, self.teams[1].id]
+        })
+        self.assertRedirects(response, f'/admin/contest/team/bulk-grade/?teams={self.teams[0].id},{self.teams[1].id}',
+                             fetch_redirect_response=False)
+        url = response['Location']
+        form = self.client.get(url).context['form']
+        self.assertEqual(len(form.attempts), 4)
+        attempt = SolvingAttempt.objects.get(team=self.teams[0], problem_id=1)
+        response = self.client.post(url, {f'grade_{attempt.pk}': 75})
+        self.assertEqual(response.status_code, 302)
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.state, attempt.grade), ('SD', 75))
+        self.assertEqual(Team.objects.get(id=self.teams[0].id).score, 625)
+
+
+class GenerateContestTest(TestCase):
+
+    def test_scores_match_generated_ledger(self):
+        call_command('generate_contest', teams=10, problems=20, attempts=60, duels=15, transactions=400, seed=1,
+                     verbosity=0)
+        self.assertEqual(Team.objects.count(), 10)
+        self.assertEqual(SolvingAttempt.objects.count(), 60)
+        self.assertEqual(Duel.objects.count(), 15)
+        self.assertEqual(Transaction.objects.count(), 400)
+        for team in Team.objects.all():
+            increased = team.increases.aggregate(total=Sum('amount'))['total'] or 0
+            decreased = team.decreases.aggregate(total=Sum('amount'))['total'] or 0
+            self.assertAlmostEqual(team.score, 500 + increased - decreased, places=6)
+            self.assertLessEqual(team.solvingattempt_set.filter(state='S').count(), 1)
+
+
+class RankingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        scores = (900, 800, 800, 700, 600, 500, 500, 400)
+        self.teams = [Team.objects.create(name=str(i), score=score) for i, score in enumerate(scores)]
+
+    def test_ties_share_rank(self):
+        board = self.client.get('/api/scoreboard/').json()
+        self.assertEqual([each['rank'] for each in board], [1, 2, 2, 4, 5, 6, 6, 8])
+        self.assertEqual([each['id'] for each in board], [team.id for team in self.teams])
+
+    def test_pagination(self):
+        page = self.client.get('/api/scoreboard/', {'limit': 3}).json()
+        self.assertEqual(page['count'], 8)
+        self.assertEqual([each['rank'] for each in page['teams']], [1, 2, 2])
+        page = self.client.get('/api/scoreboard/', {'limit': 3, 'after': page['next']}).json()
+        self.assertEqual([each['id'] for each in page['teams']], [team.id for team in self.teams[3:6]])
+        page = self.client.get('/api/scoreboard/', {'limit': 3, 'offset': 6}).json()
+        self.assertEqual([each['rank'] for each in page['teams']], [6, 8])
+        self.assertIsNone(page['next'])
+        self.assertEqual(self.client.get('/api/scoreboard/', {'limit': -1}).status_code, 400)
+
+    def test_team_rank(self):
+        team = self.teams[6]
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/teams/{team.id}/rank/')
+        data = response.json()
+        self.assertEqual(data['team']['rank'], 6)
+        self.assertEqual([(each['id'], each['rank']) for each in data['above']],
+                         [(self.teams[4].id, 5), (self.teams[5].id, 6)])
+        self.assertEqual([(each['id'], each['rank']) for each in data['below']], [(self.teams[7].id, 8)])
+        data = self.client.get(f'/api/teams/{self.teams[0].id}/rank/', {'neighbours': 1}).json()
+        self.assertEqual((data['team']['rank'], data['above'], len(data['below'])), (1, [], 1))
+        self.assertEqual(self.client.get(f'/api/teams/{Team.SHEKIB_JIB_ID}/rank/').status_code, 404)
+
+
+class ScoreHistoryTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        call_command('generate_contest', teams=8, problems=20, attempts=40, duels=10, transactions=300, seed=2,
+                     verbosity=0)
+        self.ledger = list(Transaction.objects.order_by('id'))
+
+    def replayed(self, time):
+        scores = dict.fromkeys(Team.objects.values_list('pk', flat=True), Team.INITIAL_SCORE)
+        for record in self.ledger:
+            if record.created_at is None or record.created_at <= time:
+                if record.decreased_from_id in scores:
+                    scores[record.decreased_from_id] -= record.amount
+                if record.increased_to_id in scores:
+                    scores[record.increased_to_id] += record.amount
+        return scores
+
+    def assertScores(self, actual, expected):
+        self.assertEqual(set(actual), set(expected))
+        for team_id, score in expected.items():
+            self.assertAlmostEqual(actual[team_id], score, places=6)
+
+    def test_replay_from_checkpoints(self):
+        call_command('checkpoint_scores', every=70, verbosity=0)
+        self.assertEqual(ScoreCheckpoint.objects.values('last_transaction_id').distinct().count(), 4)
+        for record in self.ledger[::37] + [self.ledger[69], self.ledger[-1]]:
+            self.assertScores(ScoreCheckpoint.objects.scores_at(record.created_at), self.replayed(record.created_at))
+        self.assertScores(ScoreCheckpoint.objects.scores_at(timezone.now()),
+                          dict(Team.objects.values_list('pk', 'score')))
+        # nothing new to checkpoint
+        self.assertEqual(ScoreCheckpoint.objects.take(every=70), 0)
+
+    def test_replay_starts_from_the_opening_score(self):
+        team = Team.objects.create(name='late', score=1000)
+        Transaction.objects.transfer(Team.SHEKIB_JIB, team, 10, Transaction.MAFIA)
+        board = scoreboard.get_scoreboard_at(timezone.now())
+        self.assertEqual(next(each['score'] for each in board['teams'] if each['id'] == team.id), 1010)
+        call_command('checkpoint_scores', every=len(self.ledger) + 1, verbosity=0)
+        self.assertEqual(ScoreCheckpoint.objects.get(team=team).score, 1010)
+        history = scoreboard.build_score_history(3)
+        scores = next(each['scores'] for each in history['teams'] if each['id'] == team.id)
+        self.assertEqual(scores[-1], 1010)
+        self.assertGreaterEqual(min(scores), 1000)
+
+    def test_entries_without_time_come_first(self):
+        # entries recorded before the ledger had times
+        untimed = self.ledger[:100]
+        Transaction.objects.filter(id__lte=untimed[-1].id).update(created_at=None)
+        for record in untimed:
+            record.created_at = None
+        call_command('checkpoint_scores', every=70, verbosity=0)
+        self.assertTrue(ScoreCheckpoint.objects.filter(time__isnull=True).exists())
+        for record in self.ledger[100::37]:
+            self.assertScores(ScoreCheckpoint.objects.scores_at(record.created_at), self.replayed(record.created_at))
+        history = scoreboard.build_score_history(5)
+        first = self.replayed(self.ledger[100].created_at)
+        for each in history['teams']:
+            self.assertAlmostEqual(each['scores'][0], first[each['id']], places=6)
+            self.assertAlmostEqual(each['scores'][-1], Team.objects.get(pk=each['id']).score, places=6)
+
+    def test_scoreboard_at(self):
+        call_command('checkpoint_scores', every=100, verbosity=0)
+        time = self.ledger[150].created_at
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/scoreboard/', {'at': time.isoformat()})
+        teams = response.json()['teams']
+        expected = self.replayed(time)
+        self.assertEqual([each['id'] for each in teams], sorted(expected, key=lambda pk: (-expected[pk], pk)))
+        self.assertEqual(teams[0]['rank'], 1)
+        self.assertEqual(self.client.get('/api/scoreboard/', {'at': 'yesterday'}).status_code, 400)
+
+    def test_score_series(self):
+        history = self.client.get('/api/scoreboard/history/', {'points': 7}).json()
+        self.assertEqual(len(history['times']), 7)
+        for time, ind in ((self.ledger[0].created_at, 0), (self.ledger[-1].created_at, 6)):
+            expected = self.replayed(time)
+            for team in history['teams']:
+                self.assertAlmostEqual(team['scores'][ind], expected[team['id']], places=6)
+        final = dict(Team.objects.values_list('pk', 'score'))
+        for team in history['teams']:
+            self.assertAlmostEqual(team['scores'][-1], final[team['id']], places=6)
+        self.assertEqual(self.client.get('/api/scoreboard/history/', {'points': 0}).status_code, 400)
+
+    def test_score_series_cached_until_ledger_changes(self):
+        self.client.get('/api/scoreboard/history/')
+        with self.assertNumQueries(1):
+            self.client.get('/api/scoreboard/history/')
+        team = Team.objects.first()
+        Transaction.objects.transfer(Team.SHEKIB_JIB, team, 10, Transaction.MAFIA)
+        history = self.client.get('/api/scoreboard/history/').json()
+        self.assertAlmostEqual(next(each for each in history['teams'] if each['id'] == team.id)['scores'][-1],
+                               Team.objects.get(pk=team.pk).score)
+
+
+class LedgerExportTest(TestCase):
+
+    def setUp(self):
+        self.teams = [Team.objects.create(name=f'team "{i}", the best') for i in range(3)]
+        for i in range(30):
+            Transaction.objects.transfer(self.teams[i % 3], self.teams[(i + 1) % 3], i, Transaction.MAFIA,
+                                         extra=f'line {i}\nnext')
+        self.teams[2].delete()
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(user)
+
+    def test_csv(self):
+        response = self.client.get('/api/transactions/export.csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        with self.assertNumQueries(1):
+            content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 30)
+        self.assertEqual((rows[0]['decreased_from_name'], rows[0]['increased_to_name'], rows[0]['extra']),
+                         (self.teams[0].name, self.teams[1].name, 'line 0\nnext'))
+        self.assertEqual((rows[1]['increased_to'], rows[1]['increased_to_name']), ('', ''))
+
+    def test_jsonl(self):
+        response = self.client.get('/api/transactions/export.jsonl')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 30)
+        self.assertEqual(json.loads(lines[29])['amount'], 29)
+        self.assertEqual(self.client.get('/api/transactions/export.xml').status_code, 404)
+
+    def test_requires_staff(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/transactions/export.csv').status_code, 403)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_ledger', format='jsonl', chunk_size=7, stdout=out)
+        self.assertEqual([json.loads(line)['id'] for line in out.getvalue().splitlines()],
+                         list(Transaction.objects.order_by('id').values_list('id', flat=True)))
+
+
+class TransactionAdminTest(TestCase):
+    URL = '/admin/contest/transaction/'
+
+    def setUp(self):
+        cache.clear()
+        self.teams = [Team.objects.create(name=f'team-{i}') for i in range(4)]
+        Transaction.objects.transfer_many([
+            Transaction(decreased_from=self.teams[i % 4], increased_to=self.teams[(i + 1) % 4], amount=i,
+                        reason=Transaction.MAFIA)
+            for i in range(250)
+        ])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def test_keyset_pages(self):
+        ids = list(Transaction.objects.order_by('-id').values_list('id', flat=True))
+        response = self.client.get(self.URL)
+        self.assertEqual([each.pk for each in response.context['cl'].result_list], ids[:100])
+        before = response.context['cl'].next_cursor
+        self.assertEqual(before, ids[99])
+        response = self.client.get(self.URL, {'before': before, 'reason': Transaction.MAFIA})
+        self.assertEqual([each.pk for each in response.context['cl'].result_list], ids[100:200])
+        response = self.client.get(self.URL, {'before': ids[199]})
+        self.assertEqual(len(response.context['cl'].result_list), 50)
+        self.assertIsNone(response.context['cl'].next_cursor)
+        self.assertNotContains(response, 'older')
+
+    def test_constant_number_of_queries_without_count(self):
+        self.client.get(self.URL)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.URL, {'decreased_from__id__exact': self.teams[0].id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cl'].result_list), 63)
+        # session, user and the page itself
+        self.assertEqual(len(queries), 3)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for metric in metrics.METRICS:
+            metric.clear()
+        self.team = Team.objects.create(name='team', score=500)
+
+    def test_off_by_default(self):
+        self.assertFalse(settings.CONTEST_METRICS)
+        self.client.get('/api/scoreboard/')
+        self.assertIs(metrics.timer('purchase'), metrics._NO_TIMER)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+        self.assertFalse(metrics.REQUEST_DURATION.series)
+
+    @override_settings(CONTEST_METRICS=True, CONTEST_METRICS_TOKEN='secret')
+    def test_restricted_to_staff_and_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+        self.client.force_login(User.objects.create_user('team'))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    @override_settings(CONTEST_METRICS=True)
+    def test_requests_and_operations(self):
+        self.client.get('/api/scoreboard/')
+        self.client.get('/api/scoreboard/')
+        form = ChangeScore({'change_score': 10, 'reason': Transaction.MAFIA}, team_id=self.team.id)
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get('/api/metrics/')
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE contest_request_duration_seconds histogram', lines)
+        self.assertIn('contest_request_duration_seconds_count{endpoint="api/scoreboard/",method="GET"} 2', lines)
+        self.assertIn('contest_request_db_queries_bucket{endpoint="api/scoreboard/",method="GET",le="+Inf"} 2', lines)
+        self.assertIn('contest_operation_duration_seconds_count{operation="score_change"} 1', lines)
+        # the cached second read only runs the version query
+        self.assertIn('contest_request_db_queries_bucket{endpoint="api/scoreboard/",method="GET",le="1.0"} 1', lines)
+
+
+class QueryBudgetTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teams = [Team.objects.create(name=f'team-{i}') for i in range(3)]
+        Problem.objects.create(id=1, level='E', type='D')
+        self.duel = Duel.objects.create(requested_by=self.teams[0], to=self.teams[1], problem_id=1, type='1')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def test_budget_exceeded_reports_repeated_queries(self):
+        with self.assertRaises(AssertionError) as raised:
+            with query_budget(2):
+                for team in self.teams:
+                    Team.objects.get(pk=team.pk)
+        message = str(raised.exception)
+        self.assertIn('query budget of 2 exceeded, 3 queries', message)
+        self.assertIn('possible N+1: 3 x from contest/tests.py', message)
+        with query_budget(3) as log:
+            for team in self.teams:
+                Team.objects.get(pk=team.pk)
+        self.assertEqual(len(log), 3)
+
+    @query_budget(3)
+    def test_team_action_page(self):
+        # session, user and the team; the form reuses the admin's team instead of fetching it again
+        response = self.client.get(f'/admin/contest/team/{self.teams[0].id}/modify-score/')
+        self.assertContains(response, str(self.teams[0]))
+
+    def test_set_winner_page(self):
+        with query_budget(3) as log:
+            response = self.client.get(f'/admin/contest/duel/{self.duel.id}/set-winner/')
+        self.assertContains(response, str(self.teams[1]))
+        self.assertFalse(log.repeated())
+
+    @override_settings(CONTEST_QUERY_PROFILE=True)
+    def test_profile_middleware_logs_call_sites(self):
+        with self.assertLogs('contest.queries', 'INFO') as logs:
+            self.client.get(f'/admin/contest/duel/{self.duel.id}/set-winner/')
+        self.assertIn(f'GET /admin/contest/duel/{self.duel.id}/set-winner/', logs.output[0])
+        self.assertIn('contest/admin.py', logs.output[0])
+
+
+class IdempotentTeamActionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.team = Team.objects.create(name='team', score=500)
+        Problem.objects.create(id=1, level='E', type='P')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+
+    def token(self, action):
+        response = self.client.get(f'/admin/contest/team/{self.team.id}/{action}/')
+        return response.context['form']['idempotency_token'].value()
+
+    def test_replayed_score_change_saves_once(self):
+        url = f'/admin/contest/team/{self.team.id}/modify-score/'
+        data = {'change_score': 10, 'reason': Transaction.MAFIA, 'idempotency_token': self.token('modify-score')}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        response = self.client.post(url, data, follow=True)
+        self.assertContains(response, 'already done')
+        self.assertEqual(Transaction.objects.filter(reason=Transaction.MAFIA).count(), 1)
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score, 510)
+        # a fresh form is a new submission
+        data['idempotency_token'] = self.token('modify-score')
+        self.client.post(url, data)
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score, 520)
+
+    def test_replayed_purchase_charges_once(self):
+        url = f'/admin/contest/team/{self.team.id}/solve-attempt/'
+        data = {'problem': 1, 'cost': 100, 'idempotency_token': self.token('solve-attempt')}
+        self.client.post(url, data)
+        self.client.post(url, data)
+        self.assertEqual(SolvingAttempt.objects.count(), 1)
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score, 400)
+
+    def test_failed_submission_can_be_retried(self):
+        url = f'/admin/contest/team/{self.team.id}/solve-attempt/'
+        data = {'problem': 1, 'cost': 100, 'idempotency_token': self.token('solve-attempt')}
+        with mock.patch.object(SolvingAttempt, 'save', side_effect=ValidationError('busy')):
+            self.client.post(url, data)
+        self.client.post(url, data)
+        self.assertEqual(SolvingAttempt.objects.count(), 1)
+
+    def test_tokens_are_shared_through_the_cache(self):
+        tokens, other_worker = RecentTokens(), RecentTokens()
+        self.assertEqual(tokens.claim('a'), (True, None))
+        self.assertEqual(other_worker.claim('a'), (False, PENDING))
+        tokens.finish('a', 'done')
+        self.assertEqual(other_worker.claim('a'), (False, 'done'))
+        other_worker.release('a')
+        self.assertEqual(tokens.claim('a'), (True, None))
+
+
+class ASGIApplicationTest(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.app = ContestASGIApplication(threads=4)
+        self.teams = [Team.objects.create(name=str(i), score=500 - i) for i in range(4)]
+
+    def tearDown(self):
+        scoreboard.broadcaster.stop()
+        self.app.executor.shutdown()
+
+    def scope(self, path, query=b'', headers=()):
+        return {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': list(headers),
+                'scheme': 'http', 'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+
+    def get(self, path, query=b''):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.app(self.scope(path, query), receive, send))
+        return (messages[0]['status'], dict(messages[0]['headers']),
+                b''.join(message.get('body', b'') for message in messages[1:]))
+
+    def test_scoreboard_matches_wsgi(self):
+        status, headers, body = self.get('/api/scoreboard/')
+        response = self.client.get('/api/scoreboard/')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), response.json())
+        self.assertEqual(headers[b'x-scoreboard-version'].decode(), response['X-Scoreboard-Version'])
+        # served from the cache, encoded once per version
+        self.assertEqual(self.get('/api/scoreboard/')[2], body)
+
+    def test_team_rank_matches_wsgi(self):
+        path = f'/api/teams/{self.teams[2].id}/rank/'
+        status, _, body = self.get(path, b'neighbours=1')
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), self.client.get(path, {'neighbours': 1}).json())
+        self.assertEqual(self.get('/api/teams/999/rank/')[0], 404)
+        self.assertEqual(self.get(path, b'neighbours=x')[0], 400)
+
+    def test_other_paths_go_through_django(self):
+        status, _, body = self.get('/api/scoreboard/', b'limit=2')
+        self.assertEqual((status, json.loads(body)['count']), (200, 4))
+        status, headers, _ = self.get('/admin/')
+        self.assertEqual(status, 302)
+        self.assertTrue(headers[b'location'].startswith(b'/admin/login/'))
+
+    def test_stream(self):
+        async def watch():
+            events = asyncio.Queue()
+            disconnect = asyncio.Event()
+
+            async def receive():
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                await events.put(message)
+
+            async def next_event():
+                while True:
+                    body = (await asyncio.wait_for(events.get(), 10)).get('body', b'')
+                    if body.startswith(b'id: '):
+                        return body
+
+            viewer = asyncio.ensure_future(self.app(self.scope('/api/scoreboard/stream/'), receive, send))
+            first = await next_event()
+            await asyncio.get_event_loop().run_in_executor(None, self.change_score)
+            second = await next_event()
+            disconnect.set()
+            await asyncio.wait_for(viewer, 10)
+            return first, second
+
+        with mock.patch.object(scoreboard.broadcaster, 'poll_interval', 0.05):
+            first, second = asyncio.run(watch())
+        self.assertNotEqual(first, second)
+        board = json.loads(second.split(b'data: ', 1)[1])
+        self.assertEqual(board[0]['id'], self.teams[3].id)
+        self.assertEqual(scoreboard.broadcaster.subscribers, 0)
+
+    def change_score(self):
+        try:
+            Transaction.objects.transfer(Team.SHEKIB_JIB, self.teams[3], 1000, Transaction.MAFIA)
+        finally:
+            connection.close()
+
+
+class AttemptAndDuelListTest(TestCase):
+
+    def setUp(self):
+        call_command('generate_contest', teams=6, problems=20, attempts=30, duels=8, transactions=200, seed=3,
+                     verbosity=0)
+        self.team = Team.objects.order_by('id').first()
+
+    def test_attempts(self):
+        with self.assertNumQueries(1):
+            attempts = self.client.get('/api/attempts/').json()
+        self.assertEqual(len(attempts), 30)
+        attempt = SolvingAttempt.objects.select_related('team', 'problem').get(pk=attempts[0]['id'])
+        self.assertEqual(
+            (attempts[0]['team'], attempts[0]['team_name'], attempts[0]['problem'], attempts[0]['problem_level']),
+            (attempt.team_id, attempt.team.name, attempt.problem_id, attempt.problem.level)
+        )
+        mine = self.client.get('/api/attempts/', {'team': self.team.id}).json()
+        self.assertEqual({each['team'] for each in mine}, {self.team.id})
+        page = self.client.get('/api/attempts/', {'after': attempts[9]['id'], 'limit': 5}).json()
+        self.assertEqual([each['id'] for each in page], [each['id'] for each in attempts[10:15]])
+
+    def test_duels(self):
+        Duel.objects.create(requested_by=self.team, to=Team.objects.order_by('id')[1],
+                            problem=Problem.objects.filter(type='D').first(), type='2')
+        with self.assertNumQueries(1):
+            duels = self.client.get('/api/duels/').json()
+        self.assertEqual(len(duels), 9)
+        self.assertEqual((duels[-1]['winner'], duels[-1]['winner_name'], duels[-1]['to_name']),
+                         (None, None, Team.objects.order_by('id')[1].name))
+        mine = self.client.get('/api/duels/', {'team': self.team.id}).json()
+        self.assertTrue(mine)
+        self.assertTrue(all(self.team.id in (each['requested_by'], each['to']) for each in mine))
+
+
+class TeamDetailTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        call_command('generate_contest', teams=6, problems=20, attempts=40, duels=12, transactions=200, seed=4,
+                     verbosity=0)
+        self.team, self.other = Team.objects.order_by('id')[:2]
+        self.url = f'/api/teams/{self.team.id}/'
+
+    def test_statistics(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url).json()
+        team = self.team
+        solved = [attempt for attempt in team.solvingattempt_set.all() if attempt.state == 'SD']
+        durations = [attempt.duration.total_seconds() for attempt in solved]
+        duels = Duel.objects.filter(Q(requested_by=team) | Q(to=team))
+        self.assertEqual((data['name'], data['solved_count'], data['active_problems']),
+                         (team.name, team.solved_problems, team.solvingattempt_set.filter(state='S').count()))
+        self.assertAlmostEqual(data['average_solve_duration'], sum(durations) / len(durations), places=3)
+        self.assertAlmostEqual(data['total_spent'], team.decreases.filter(reason='PR').aggregate(s=Sum('amount'))['s'])
+        self.assertAlmostEqual(data['total_earned'],
+                               team.increases.filter(reason='PS').aggregate(s=Sum('amount'))['s'] or 0)
+        self.assertEqual((data['pending_duels'], data['duels_won'], data['duels_lost']),
+                         (duels.filter(pending=True).count(), duels.filter(winner=team).count(),
+                          duels.filter(pending=False).exclude(winner=team).count()))
+        self.assertEqual(self.client.get(f'/api/teams/{Team.SHEKIB_JIB_ID}/').status_code, 404)
+
+    def test_cached_until_the_team_changes(self):
+        before = self.client.get(self.url).json()
+        Transaction.objects.transfer(Team.SHEKIB_JIB, self.other, 10, Transaction.MAFIA)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        Transaction.objects.transfer(Team.SHEKIB_JIB, self.team, 10, Transaction.MAFIA)
+        with self.assertNumQueries(3):
+            after = self.client.get(self.url).json()
+        self.assertAlmostEqual(after['score'], before['score'] + 10)
+        Duel.objects.create(requested_by=self.team, to=self.other, problem=Problem.objects.filter(type='D').first(),
+                            type='1')
+        self.assertEqual(self.client.get(self.url).json()['pending_duels'], before['pending_duels'] + 1)
+
+
+class ProblemStatisticsTest(TestCase):
+
+    def setUp(self):
+        call_command('generate_contest', teams=6, problems=20, attempts=40, duels=0, transactions=100, seed=5,
+                     verbosity=0)
+        self.team = Team.objects.create(name='stats')
+        self.problems = list(Problem.objects.filter(type='P').exclude(solvingattempt__team=self.team)[:3])
+
+    def rows(self):
+        return list(ProblemStatistics.objects.order_by('problem_id').values())
+
+    def assertMatchesRebuild(self):
+        maintained = self.rows()
+        ProblemStatistics.objects.rebuild()
+        rebuilt = self.rows()
+        self.assertEqual(len(maintained), len(rebuilt))
+        for row, expected in zip(maintained, rebuilt):
+            duration = row.pop('duration_total')
+            self.assertAlmostEqual(duration, expected.pop('duration_total'), places=3)
+            self.assertEqual(row, expected)
+
+    def buy(self, problem, cost=150):
+        attempt = SolvingAttempt(team=self.team, problem=problem, cost=cost, start_time=timezone.now())
+        attempt.save()
+        return attempt
+
+    def test_maintained_on_start_return_and_grade(self):
+        self.assertMatchesRebuild()
+        first, second, third = self.problems
+        attempt = self.buy(first)
+        attempt.end_time, attempt.state = timezone.now() + timedelta(minutes=30), 'C'
+        attempt.save()
+        attempt = SolvingAttempt.objects.get(pk=attempt.pk)
+        attempt.grade = 75
+        attempt.save(cal_reward=True)
+        self.buy(second)
+        self.buy(third)
+        SolvingAttempt.objects.grade_many([(self.team.id, third.id, 50)],
+                                          end_time=timezone.now() + timedelta(minutes=10))
+        self.assertMatchesRebuild()
+        SolvingAttempt.objects.get(team=self.team, problem=second).delete()
+        self.assertMatchesRebuild()
+
+    def test_graded_through_the_admin_form(self):
+        attempt = self.buy(self.problems[0])
+        form = SetGradeForm({'problem': str(attempt.problem_id), 'grade': '75'}, team_id=self.team.id)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        attempt.refresh_from_db()
+        self.assertEqual((attempt.state, attempt.grade), ('SD', 75))
+        self.assertEqual(Team.objects.get(pk=self.team.pk).score,
+                         Team.INITIAL_SCORE + attempt.problem.calculate_reward(attempt.cost, 75))
+        self.assertMatchesRebuild()
+
+    def test_endpoint(self):
+        first = self.problems[0]
+        attempt = self.buy(first, cost=120)
+        attempt.end_time, attempt.grade = attempt.start_time + timedelta(minutes=20), 100
+        attempt.save(cal_reward=True)
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/problems/stats/').json()
+        self.assertEqual([row['problem'] for row in data], sorted(row['problem'] for row in data))
+        attempts = SolvingAttempt.objects.filter(problem=first)
+        row = next(row for row in data if row['problem'] == first.id)
+        solved = [each for each in attempts if each.state == 'SD']
+        finished = [each.duration.total_seconds() for each in attempts if each.end_time]
+        self.assertEqual((row['attempts'], row['solved'], row['level']), (len(attempts), len(solved), first.level))
+        self.assertAlmostEqual(row['solve_rate'], len(solved) / len(attempts))
+        self.assertAlmostEqual(row['average_grade'], sum(each.grade for each in solved) / len(solved))
+        self.assertAlmostEqual(row['average_cost'], sum(each.cost for each in attempts) / len(attempts))
+        self.assertAlmostEqual(row['average_duration'], sum(finished) / len(finished), places=3)
+        levels = {row['level'] for row in self.client.get('/api/problems/stats/?level=H').json()}
+        self.assertLessEqual(levels, {'H'})
@@ -3,4 +3,14 @@ from contest import views
 
 urlpatterns = [
     path('scoreboard/', views.ScoreboardView.as_view()),
+    path('scoreboard/stream/', views.scoreboard_stream),
+    path('scoreboard/history/', views.ScoreHistoryView.as_view()),
+    path('attempts/', views.SolvingAttemptListView.as_view()),
+    path('attempts/grade/', views.BulkGradeView.as_view()),
+    path('problems/stats/', views.ProblemStatisticsView.as_view()),
+    path('duels/', views.DuelListView.as_view()),
+    path('teams/<int:pk>/', views.TeamDetailView.as_view()),
+    path('teams/<int:pk>/rank/', views.TeamRankView.as_view()),
+    path('transactions/export.<str:kind>', views.LedgerExportView.as_view()),
+    path('metrics/', views.metrics_view),
 ]
@@ -1,21 +1,223 @@
-from django.http import HttpResponseRedirect
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db.models import Q
+from django.http import Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import generics
+from rest_framework.exceptions import ParseError, ValidationError as APIValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import metrics
+from .export import EXPORT_FORMATS, export_ledger
 from .forms import RequestProblemForm
 from .models import *
+from .scoreboard import (broadcaster, get_score_history, get_scoreboard, get_scoreboard_at, get_scoreboard_delta,
+                         get_scoreboard_page, get_team_details, get_team_rank)
 from .serializers import *
 
 
+def int_param(request, name, default=None):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ParseError(f'{name} must be a number')
+    if value < 0:
+        raise ParseError(f'{name} cannot be negative')
+    return value
+
+
+def datetime_param(request, name):
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ParseError(f'{name} must be an ISO 8601 date and time')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
 class ScoreboardView(generics.ListAPIView):
     serializer_class = TeamSerializers
     queryset = Team.objects.all()
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        data = self.get_serializer(queryset, many=True).data
-        for ind, each in enumerate(data):
-            each['rank'] = ind+1
-        return Response(data)
+        at = datetime_param(request, 'at')
+        if at is not None:
+            return Response(get_scoreboard_at(at))
+        since = int_param(request, 'since')
+        if since is not None:
+            return Response(get_scoreboard_delta(since))
+        if {'limit', 'offset', 'after'} & set(request.query_params):
+            return Response(get_scoreboard_page(
+                limit=int_param(request, 'limit'),
+                offset=int_param(request, 'offset', 0),
+                after=int_param(request, 'after'),
+            ))
+        board = get_scoreboard()
+        return Response(board['teams'], headers={'X-Scoreboard-Version': board['version']})
+
+
+class TeamDetailView(APIView):
+    """
+    A team with its solved and active problems, spending, earnings, average
+    solve duration (in seconds) and duel record.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        try:
+            return Response(get_team_details(pk))
+        except Team.DoesNotExist:
+            raise Http404
+
+
+class TeamRankView(APIView):
+    """
+    One team's rank and its `neighbours` (default 2) above and below, without
+    loading the whole scoreboard.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        try:
+            return Response(get_team_rank(pk, min(int_param(request, 'neighbours', 2), 50)))
+        except Team.DoesNotExist:
+            raise Http404
+
+
+class KeysetListView(generics.ListAPIView):
+    """
+    Read only list in id order, `limit` rows (default 1000) after the id `after`.
+    """
+    max_limit = 5000
+
+    def filter_queryset(self, queryset):
+        queryset = queryset.order_by('id')
+        after = int_param(self.request, 'after')
+        if after is not None:
+            queryset = queryset.filter(id__gt=after)
+        return queryset[:min(int_param(self.request, 'limit', 1000), self.max_limit)]
+
+
+class SolvingAttemptListView(KeysetListView):
+    serializer_class = SolvingAttemptListSerializer
+
+    def get_queryset(self):
+        queryset = SolvingAttempt.objects.select_related('team', 'problem')
+        team = int_param(self.request, 'team')
+        if team is not None:
+            queryset = queryset.filter(team_id=team)
+        return queryset
+
+
+class DuelListView(KeysetListView):
+    serializer_class = DuelListSerializer
+
+    def get_queryset(self):
+        queryset = Duel.objects.select_related('requested_by', 'to', 'winner')
+        team = int_param(self.request, 'team')
+        if team is not None:
+            queryset = queryset.filter(Q(requested_by_id=team) | Q(to_id=team))
+        return queryset
+
+
+class ProblemStatisticsView(generics.ListAPIView):
+    """
+    Solve rate, average grade, cost and duration of every attempted problem,
+    optionally of one `level`, read from the ProblemStatistics table.
+    """
+    serializer_class = ProblemStatisticsSerializer
+
+    def get_queryset(self):
+        queryset = ProblemStatistics.objects.select_related('problem').order_by('problem_id')
+        level = self.request.query_params.get('level')
+        if level is not None:
+            queryset = queryset.filter(problem__level=level)
+        return queryset
+
+
+class ScoreHistoryView(APIView):
+    """
+    Every team's score over the contest, sampled at `points` (default 100) moments.
+    """
+
+    def get(self, request, *args, **kwargs):
+        points = int_param(request, 'points', 100)
+        if not 1 <= points <= 1000:
+            raise ParseError('points must be between 1 and 1000')
+        return Response(get_score_history(points))
+
+
+def scoreboard_stream(request):
+    """
+    Server-sent events stream of the ranked scoreboard, one event per change.
+    """
+    last_version = request.META.get('HTTP_LAST_EVENT_ID')
+    last_version = int(last_version) if last_version and last_version.isdigit() else None
+    response = StreamingHttpResponse(broadcaster.subscribe(last_version), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class BulkGradeView(APIView):
+    """
+    Grades many solving attempts in one transaction, takes a list of
+    {"team": <id>, "problem": <id>, "grade": <0-100>}.
+    """
+    permission_classes = (IsAdminUser, )
+
+    def post(self, request, *args, **kwargs):
+        serializer = GradeSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            graded = SolvingAttempt.objects.grade_many(
+                (each['team'], each['problem'], each['grade']) for each in serializer.validated_data
+            )
+        except ValidationError as e:
+            raise APIValidationError(e.messages)
+        return Response([
+            {'team': attempt.team_id, 'problem': attempt.problem_id, 'grade': attempt.grade, 'reward': reward}
+            for attempt, reward in graded
+        ])
+
+
+class LedgerExportView(APIView):
+    """
+    Streams the whole Transaction ledger as `export.csv` or `export.jsonl`.
+    """
+    permission_classes = (IsAdminUser, )
+    content_types = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+    def get(self, request, kind, *args, **kwargs):
+        if kind not in EXPORT_FORMATS:
+            raise Http404
+        response = StreamingHttpResponse(export_ledger(kind), content_type=self.content_types[kind])
+        response['Content-Disposition'] = f'attachment; filename="ledger.{kind}"'
+        return response
+
+
+def metrics_view(request):
+    """
+    Request and operation timings in the Prometheus text format, 404 while metrics are off.
+    Served to staff users and to scrapers sending `Authorization: Bearer <CONTEST_METRICS_TOKEN>`.
+    """
+    if not metrics.enabled():
+        raise Http404
+    if not request.user.is_staff:
+        token = settings.CONTEST_METRICS_TOKEN
+        if not token or not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+            raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,109 @@
+"""
+Optional single writer for score mutations.
+
+SQLite allows one writer at a time, so concurrent judges contend for its lock
+and may get "database is locked". With settings.CONTEST_WRITE_QUEUE on, the
+functions decorated with @serialized_write are handed to one worker thread,
+which applies them in batches, each batch in a single database transaction
+and each mutation in a savepoint of its own, while the callers wait for
+their result.
+"""
+import functools
+import queue
+import threading
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import connection, transaction
+
+
+class WriteQueue:
+
+    def __init__(self, batch_size=50):
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self._worker = None
+
+    def start(self):
+        with self.lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name='score-writer', daemon=True)
+                self._worker.start()
+
+    def stop(self):
+        with self.lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self.queue.put(None)
+            worker.join()
+
+    def in_worker(self):
+        return threading.current_thread() is self._worker
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queues `func(*args, **kwargs)`, returns a Future of its result.
+        """
+        self.start()
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def _next_batch(self):
+        batch = [self.queue.get()]
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                stopped = batch[-1] is None
+                self._apply([each for each in batch if each is not None])
+                if stopped:
+                    return
+        finally:
+            connection.close()
+
+    def _apply(self, batch):
+        outcomes = []
+        try:
+            with transaction.atomic():
+                for future, func, args, kwargs in batch:
+                    try:
+                        # a failing mutation only rolls back its own savepoint
+                        with transaction.atomic():
+                            outcomes.append((future, True, func(*args, **kwargs)))
+                    except Exception as e:
+                        outcomes.append((future, False, e))
+        except Exception as e:
+            for future, *_ in batch:
+                future.set_exception(e)
+            return
+        for future, succeeded, outcome in outcomes:
+            if succeeded:
+                future.set_result(outcome)
+            else:
+                future.set_exception(outcome)
+
+
+write_queue = WriteQueue(batch_size=getattr(settings, 'CONTEST_WRITE_QUEUE_BATCH', 50))
+
+
+def serialized_write(func):
+    """
+    Runs the decorated mutation on the writer thread when the queue is on.
+    It runs in place when the queue is off, when already on the writer, and
+    inside a caller's transaction, whose lock the writer would wait on forever.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not settings.CONTEST_WRITE_QUEUE or write_queue.in_worker() or connection.in_atomic_block:
+            return func(*args, **kwargs)
+        return write_queue.submit(func, *args, **kwargs).result()
+    return wrapper